@@ -0,0 +1,134 @@
+import gc
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+# Imported up front so loading it is not counted as grid memory
+import numpy
+
+import graph
+import hexagon
+import hexgrid
+import terrain
+import world
+
+#
+# Benchmarks for world generation. Run as a script to print a report, e.g.
+#   python benchmarks.py
+#
+
+# World that stops after building its hex grid, so grid memory can be measured in isolation
+class GridOnlyWorld(world.World):
+    def __init__(self, worldWidth, worldHeight, hexesInOddRow=10, useArrayGrid=False):
+        self.worldWidth = worldWidth
+        self.worldHeight = worldHeight
+        self.hexesInOddRow = hexesInOddRow
+        self.hexMap = dict()
+        self.grid = None
+        if useArrayGrid:
+            self.hexGrid = self.createArrayHexGrid()
+        else:
+            self.hexGrid = self.createHexGridFromPoints()
+
+# Copy of a slotted class whose instances keep their attributes in a __dict__, as they did before
+#  slots were declared. Methods and properties are copied from the whole hierarchy, so it behaves the same.
+def createUnslottedClass(slottedClass):
+    namespace = dict()
+    for baseClass in reversed(slottedClass.__mro__[:-1]):
+        slotNames = set(getattr(baseClass, "__slots__", ())) | set(("__slots__", "__dict__", "__weakref__"))
+        namespace.update((name, value) for name, value in vars(baseClass).items() if not name in slotNames)
+    return type(slottedClass.__name__, (), namespace)
+
+# Hex and vertex classes that grids are built from, by the module that creates them
+GRID_CLASSES = ((graph, "Vertex"), (hexagon, "Hexagon"), (hexgrid, "HexagonView"), (hexgrid, "VertexView"))
+
+# Measure the memory held by a freshly built hex grid, reported in bytes per hex.
+#  With unslotted, hexes and vertices are built from copies of their classes without slots.
+def benchmarkGridMemory(worldWidth=800, worldHeight=600, hexesInOddRow=200, useArrayGrid=False, unslotted=False):
+    slottedClasses = [getattr(module, name) for module, name in GRID_CLASSES]
+    if unslotted:
+        for (module, name), slottedClass in zip(GRID_CLASSES, slottedClasses):
+            setattr(module, name, createUnslottedClass(slottedClass))
+    try:
+        gc.collect()
+        tracemalloc.start()
+        t0 = time.time()
+        gridWorld = GridOnlyWorld(worldWidth, worldHeight, hexesInOddRow, useArrayGrid)
+        t1 = time.time()
+        gc.collect()
+        allocatedBytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+    finally:
+        for (module, name), slottedClass in zip(GRID_CLASSES, slottedClasses):
+            setattr(module, name, slottedClass)
+    totalHexes = len(gridWorld.hexMap)
+    return {
+        "hexes": totalHexes,
+        "bytes": allocatedBytes,
+        "bytesPerHex": allocatedBytes / float(totalHexes),
+        "buildTime": t1-t0,
+    }
+
+def printGridMemoryReport(hexesInOddRow=200):
+    for useArrayGrid in (False, True):
+        for unslotted in (True, False):
+            result = benchmarkGridMemory(hexesInOddRow=hexesInOddRow, useArrayGrid=useArrayGrid, unslotted=unslotted)
+            print("%s grid, %s, %d hexes: %.0f bytes per hex (%.1f MB), built in %.2fs" % (
+                "Array" if useArrayGrid else "Object", "unslotted" if unslotted else "slotted", result["hexes"],
+                result["bytesPerHex"], result["bytes"] / 1e6, result["buildTime"]))
+
+# Startup budget, in seconds from process start, for headless generation
+STARTUP_BUDGETS = {
+    "importWorld": 0.5,
+    "firstWorldCall": 1.5,
+}
+
+# Child process script printing the time at which each startup milestone is reached
+STARTUP_SCRIPT = """
+import time
+import world
+print("importWorld %f" % time.time())
+world.World(800, 600, 10)
+print("firstWorldCall %f" % time.time())
+"""
+
+# Measure, in a fresh interpreter, how long until world is imported and until a first World is built
+def benchmarkStartup():
+    t0 = time.time()
+    output = subprocess.check_output([sys.executable, "-c", STARTUP_SCRIPT], universal_newlines=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)))
+    milestones = dict()
+    for line in output.splitlines():
+        name, _, timestamp = line.partition(" ")
+        if name in STARTUP_BUDGETS:
+            milestones[name] = float(timestamp) - t0
+    return milestones
+
+def printStartupReport():
+    milestones = benchmarkStartup()
+    for name in sorted(STARTUP_BUDGETS, key=lambda n: milestones[n]):
+        withinBudget = "ok" if milestones[name] <= STARTUP_BUDGETS[name] else "OVER BUDGET"
+        print("%s after %.2fs (budget %.2fs): %s" % (name, milestones[name], STARTUP_BUDGETS[name], withinBudget))
+
+# Time full noise field generation for each pool size
+def benchmarkNoise(width=4096, height=4096, processCounts=(1, 2, 4)):
+    times = dict()
+    for processes in processCounts:
+        t0 = time.time()
+        terrain.createNoiseArray(width, height, processes=processes)
+        times[processes] = time.time() - t0
+    return times
+
+def printNoiseReport(width=4096, height=4096):
+    processCounts = sorted(set((1, 2, os.cpu_count() or 1)))
+    times = benchmarkNoise(width, height, processCounts)
+    for processes in processCounts:
+        print("Noise %dx%d with %d process(es): %.2fs (%.1fx)" % (width, height, processes, times[processes], times[1] / times[processes]))
+
+if __name__ == '__main__':
+    hexesInOddRow = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    printStartupReport()
+    printGridMemoryReport(hexesInOddRow)
+    printNoiseReport()
@@ -0,0 +1,31 @@
+import os
+import random
+
+import pytest
+
+import masks
+import world
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+MASK_FILE = os.path.join(PACKAGE_DIR, "groundtruth4.bmp")
+
+# Builds worlds over the groundtruth4 mask from a fixed seed, so every world sees the same islands.
+#  Keyword options are passed on to World, e.g. makeMaskedWorld(useArrayGrid=True).
+@pytest.fixture
+def makeMaskedWorld():
+    def makeWorld(**options):
+        random.seed(3)
+        return world.World(800, 600, 40, True, masks.loadMask(MASK_FILE), **options)
+    return makeWorld
+
+# Masked world with default options, or with the options a test passes through indirect parametrisation:
+#  @pytest.mark.parametrize("maskedWorld", [{"useArrayGrid": True}], indirect=True)
+@pytest.fixture
+def maskedWorld(request, makeMaskedWorld):
+    return makeMaskedWorld(**getattr(request, "param", {}))
+
+# Small world without a mask, built from a fixed seed
+@pytest.fixture
+def smallWorld():
+    random.seed(3)
+    return world.World(800, 600, 10)
@@ -0,0 +1,75 @@
+import time
+
+import lazyimport
+
+np = lazyimport.LazyModule("numpy")
+ndimage = lazyimport.LazyModule("scipy.ndimage")
+spatial = lazyimport.LazyModule("scipy.spatial")
+
+#
+# Distance-to-coast for a whole world from a single Euclidean distance
+# transform. Land and water hexes are rasterised once, each pixel taking the
+# class of the hex centre nearest to it, and every pixel then knows its
+# distance to the coast and the closest point on it. Regions read both off by
+# bilinear sampling at their vertices, so the cost does not depend on how many
+# islands or bodies of water the world has.
+#
+
+class CoastDistanceField():
+    # centres is an (n, 2) array of hex centres and isLandHex an (n,) boolean array.
+    #  pixelsPerUnit sets the raster resolution relative to world coordinates.
+    def __init__(self, worldWidth, worldHeight, centres, isLandHex, pixelsPerUnit=1.0):
+        t0 = time.time()
+        self.pixelsPerUnit = pixelsPerUnit
+        self.width = max(1, int(np.ceil(worldWidth * pixelsPerUnit)))
+        self.height = max(1, int(np.ceil(worldHeight * pixelsPerUnit)))
+        isLand = self.rasteriseHexes(centres, isLandHex)
+        # Signed distance to the coast in world units, positive on land and negative on water,
+        #  and the coordinates of the closest coast point for every pixel
+        self.signedDistances = np.zeros((self.height, self.width))
+        self.coastXs = np.zeros((self.height, self.width))
+        self.coastYs = np.zeros((self.height, self.width))
+        for pixelMask, sign in ((isLand, 1), (~isLand, -1)):
+            # Pixels of the other class are the zeros the transform measures to
+            if pixelMask.all() or not pixelMask.any():
+                continue
+            pixelDistances, (nearestRows, nearestCols) = ndimage.distance_transform_edt(pixelMask, return_indices=True)
+            rows, cols = np.nonzero(pixelMask)
+            pixelDistances = pixelDistances[rows, cols]
+            # The coast lies half a pixel short of the nearest pixel of the other class
+            coastFractions = (pixelDistances - 0.5) / pixelDistances
+            self.signedDistances[rows, cols] = sign * (pixelDistances - 0.5) / pixelsPerUnit
+            self.coastXs[rows, cols] = (cols + 0.5 + (nearestCols[rows, cols] - cols) * coastFractions) / pixelsPerUnit
+            self.coastYs[rows, cols] = (rows + 0.5 + (nearestRows[rows, cols] - rows) * coastFractions) / pixelsPerUnit
+        print("Created coast distance field of %dx%d pixels in %f" % (self.width, self.height, time.time()-t0))
+
+    # Boolean raster of land, with each pixel taking the class of its nearest hex centre
+    def rasteriseHexes(self, centres, isLandHex):
+        rows, cols = np.mgrid[0:self.height, 0:self.width]
+        pixelCentres = np.column_stack(((cols.ravel() + 0.5) / self.pixelsPerUnit, (rows.ravel() + 0.5) / self.pixelsPerUnit))
+        _, nearestHexes = spatial.cKDTree(centres).query(pixelCentres, k=1, workers=-1)
+        return np.asarray(isLandHex, dtype=bool)[nearestHexes].reshape(self.height, self.width)
+
+    # Bilinear interpolation of a raster at world coordinates
+    def sampleRaster(self, raster, xs, ys):
+        u = np.clip(np.asarray(xs, dtype=np.float64) * self.pixelsPerUnit - 0.5, 0, self.width-1)
+        v = np.clip(np.asarray(ys, dtype=np.float64) * self.pixelsPerUnit - 0.5, 0, self.height-1)
+        col0 = np.minimum(u.astype(np.intp), self.width-2) if self.width > 1 else np.zeros(u.shape, dtype=np.intp)
+        row0 = np.minimum(v.astype(np.intp), self.height-2) if self.height > 1 else np.zeros(v.shape, dtype=np.intp)
+        col1 = np.minimum(col0 + 1, self.width-1)
+        row1 = np.minimum(row0 + 1, self.height-1)
+        fu = u - col0
+        fv = v - row0
+        bottom = raster[row0, col0] * (1 - fu) + raster[row0, col1] * fu
+        top = raster[row1, col0] * (1 - fu) + raster[row1, col1] * fu
+        return bottom * (1 - fv) + top * fv
+
+    # Distances to the coast, never negative, and vectors to the closest coast point, for points
+    #  on land (onLand=True) or in water. Points on the other side of the coast get a distance of zero.
+    def sample(self, xs, ys, onLand=True):
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        signedDistances = self.sampleRaster(self.signedDistances, xs, ys)
+        distances = np.maximum(signedDistances if onLand else -signedDistances, 0)
+        coastVectors = np.column_stack((self.sampleRaster(self.coastXs, xs, ys) - xs, self.sampleRaster(self.coastYs, xs, ys) - ys))
+        return distances, coastVectors
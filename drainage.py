@@ -1,55 +1,114 @@
-import pyglet
-from pyglet.gl import *
-from pyglet import image
 import random
 import copy
-from itertools import chain
+import heapq
+from itertools import chain, count
 import struct
 
 import graph
-import drawUtils
+import lazyimport
+
+drawUtils = lazyimport.LazyModule("drawUtils")
+
+#
+# Drainage trees laid out in depth-first (Euler tour) order. Every hex is
+# followed by all the hexes upstream of it, so the hexes draining through
+# any hex, and each whole basin, are a contiguous slice of one list. Upstream
+# counts must already be known, see accumulateFlow.
+#
+class DrainageForest():
+    # terminatingHexes are the roots, such as a land's outflows and sinks
+    def __init__(self, terminatingHexes):
+        self.hexes = []
+        # Position of the root of the tree containing each position
+        self.rootEntries = []
+        for terminatingHex in terminatingHexes:
+            treeHexes = findHexesDrainedAbove(terminatingHex)
+            self.rootEntries.extend([len(self.hexes)] * len(treeHexes))
+            self.hexes.extend(treeHexes)
+        # Position of each hex in the layout, keyed by hexIndex
+        self.hexEntries = dict((nextHex.hexIndex, entry) for entry, nextHex in enumerate(self.hexes))
+
+    def __contains__(self, hexagon):
+        return hexagon.hexIndex in self.hexEntries
+
+    # Slice of the layout holding a hex and everything upstream of it
+    def getUpstreamRange(self, hexagon):
+        entry = self.hexEntries[hexagon.hexIndex]
+        return entry, entry + hexagon.upstreamCount + 1
+
+    def getHexesDrainedAbove(self, hexagon):
+        start, end = self.getUpstreamRange(hexagon)
+        return self.hexes[start+1:end]
+
+    # Whether water from upstreamHex drains through downstreamHex
+    def drainsThrough(self, upstreamHex, downstreamHex):
+        start, end = self.getUpstreamRange(downstreamHex)
+        return start <= self.hexEntries.get(upstreamHex.hexIndex, -1) < end
+
+    # Outflow or sink that a hex drains to
+    def getTerminatingHex(self, hexagon):
+        return self.hexes[self.rootEntries[self.hexEntries[hexagon.hexIndex]]]
 
 class DrainageBasin():
-    def __init__(self, terminatingHex):
+    # Hexes are read from the slice of drainageForest rooted at terminatingHex, or found by walking upstream
+    def __init__(self, terminatingHex, drainageForest=None):
         self.id = next(basinIdGen)
         self.terminatingHex = terminatingHex
-        self.hexes = [terminatingHex] + terminatingHex.hexesDrainedAbove
+        self.drainageForest = drainageForest
         self.basinColor = (random.random(), random.random(), random.random(), 0.2)
 
+    @property
+    def hexes(self):
+        if self.drainageForest:
+            start, end = self.drainageForest.getUpstreamRange(self.terminatingHex)
+            return self.drainageForest.hexes[start:end]
+        return findHexesDrainedAbove(self.terminatingHex)
+
+    def getTotalHexes(self):
+        return self.terminatingHex.upstreamCount + 1
+
+    def containsHex(self, hexagon):
+        if self.drainageForest:
+            return hexagon in self.drainageForest and self.drainageForest.getTerminatingHex(hexagon) is self.terminatingHex
+        return hexagon in self.hexes
+
     def drawDrainageBasin(self):
         #print("Drawing hexes for basin %d" % (self.id))
         for nextHex in self.hexes:
             nextHex.drawFilledHex(self.basinColor, False)
 
 class River():
-    def __init__(self, terminatingHex):
+    def __init__(self, terminatingHex, drainageForest=None):
         self.terminatingHex = terminatingHex
         self.routeHexes = list()
         self.sourceHexes = set()
-        self.traceFlow(self.terminatingHex)
+        self.traceFlow(self.terminatingHex, drainageForest)
         self.path_vertex_list = None
 
-    # River follows sequence of hexagons 
-    def traceFlow(self, currentHex):
-        self.routeHexes.append(currentHex)
-        if currentHex.drainedNeighbours:
-            # Depth first search of all included hexagons
-            for nextDrainedHex in currentHex.drainedNeighbours:
-                self.traceFlow(nextDrainedHex)
+    # River follows sequence of hexagons, found by a depth first search of all included hexagons
+    #  or read from drainageForest
+    def traceFlow(self, currentHex, drainageForest=None):
+        if drainageForest:
+            start, end = drainageForest.getUpstreamRange(currentHex)
+            drainedHexes = drainageForest.hexes[start:end]
         else:
-            # Drains from no other hexes
-            self.sourceHexes.add(currentHex)
+            drainedHexes = findHexesDrainedAbove(currentHex)
+        for nextHex in drainedHexes:
+            self.routeHexes.append(nextHex)
+            if not nextHex.drainedNeighbours:
+                # Drains from no other hexes
+                self.sourceHexes.add(nextHex)
 
     def getRiverPoints(self, riverPoints, minDrainedAbove=0, minTotalDrainedAtMouth=False):
-        if len(self.terminatingHex.hexesDrainedAbove) > minTotalDrainedAtMouth:
+        if self.terminatingHex.upstreamCount > minTotalDrainedAtMouth:
             for nextHex in self.routeHexes:
-                if len(nextHex.hexesDrainedAbove) >= minDrainedAbove:
+                if nextHex.upstreamCount >= minDrainedAbove:
                     getDrainageRoutePoints(riverPoints, nextHex, minDrainedAbove)
 
     def drawRiver(self, useSimpleRoutes=True, minDrainedAbove=0, minTotalDrainedAtMouth=False):
-        if len(self.terminatingHex.hexesDrainedAbove) > minTotalDrainedAtMouth:
+        if self.terminatingHex.upstreamCount > minTotalDrainedAtMouth:
             for nextHex in self.routeHexes:
-                if len(nextHex.hexesDrainedAbove) >= minDrainedAbove:
+                if nextHex.upstreamCount >= minDrainedAbove:
                     drawDrainageRoute(nextHex, useSimpleRoutes=useSimpleRoutes)
 
     def buildBatch(self, batch):
@@ -58,6 +117,12 @@ class River():
 # Initialise a generator for 
 basinIdGen = graph.idGenerator()
 
+# Hexes without an altitude (bodies of water) are lower than any land
+def getDrainageAltitude(hexagon):
+    if hexagon.centre.altitude is None:
+        return float('-inf')
+    return hexagon.centre.altitude
+
 # Based on point altitudes, determine which neighbouring hex is the steeper descent
 # Used for drainage basin calculation
 def findDrainingNeighbour(hexagon):
@@ -65,11 +130,11 @@ def findDrainingNeighbour(hexagon):
         lowestPoint = hexagon.findLowestPoint()
         # Determine which of the hexagons neighbouring this point has the lowest altitude
         lowestHexes = [lowestPoint.surroundingHexes[0]]
-        for nextHex in lowestPoint.surroundingHexes.values():
-            if nextHex.centre.altitude < lowestHexes[0].centre.altitude:
+        for nextHex in lowestPoint.surroundingHexes:
+            if getDrainageAltitude(nextHex) < getDrainageAltitude(lowestHexes[0]):
                 # A preferred draining hex has been found
                 lowestHexes = [nextHex]
-            elif nextHex.centre.altitude == lowestHexes[0].centre.altitude:
+            elif getDrainageAltitude(nextHex) == getDrainageAltitude(lowestHexes[0]):
                 # This hex is equal altitude so equally suitable
                 lowestHexes.append(nextHex)
         # If hexagon would be best choice for draining, indicate that draining should be terminated
@@ -78,28 +143,125 @@ def findDrainingNeighbour(hexagon):
             if not chosenHex == hexagon:
                 # Update who drains whom
                 hexagon.drainingNeighbour = chosenHex
-                chosenHex.drainedNeighbours.extend([hexagon])
+                chosenHex.drainedNeighbours += (hexagon,)
                 #print("Appended hexagon %s to hex%s's drainedNeighbours, now at: %d" % (str(hexagon.hexIndex), str(chosenHex.hexIndex), len(chosenHex.drainedNeighbours)))
-                # Give draining hex the volume of water it receives from this hex
-                #print("Giving chosenHex wRec + qD, %d + %d" % (hexagon.waterReceived, hexagon.quantityDrained))
-                chosenHex.quantityDrained += hexagon.waterReceived + hexagon.quantityDrained
+                # Volumes of water drained are totalled afterwards, by accumulateFlow
                 return chosenHex
         # chosenHex must have been hexagon
         hexagon.drainingNeighbour = hexagon
     # Return none if hexagon is water, or drains to itself (is sink)
     return None
 
+# Total the water and number of hexes draining through each of the given hexes, once every hex has its
+#  drainingNeighbour. Hexes are visited in topological order along drainingNeighbour, starting from those
+#  nothing drains into, so each passes its totals on only once they are complete. Drainage out of the given
+#  hexes, as into water, is not followed, and hexes in drainage cycles are left unvisited.
+def accumulateFlow(hexes):
+    hexes = list(hexes)
+    remainingInflows = dict((nextHex.hexIndex, len(nextHex.drainedNeighbours)) for nextHex in hexes)
+    for nextHex in hexes:
+        nextHex.upstreamCount = 0
+        nextHex.quantityDrained = 0
+    readyHexes = [nextHex for nextHex in hexes if not nextHex.drainedNeighbours]
+    while readyHexes:
+        nextHex = readyHexes.pop()
+        drainingHex = nextHex.drainingNeighbour
+        if not drainingHex or drainingHex is nextHex or not drainingHex.hexIndex in remainingInflows:
+            continue
+        drainingHex.upstreamCount += nextHex.upstreamCount + 1
+        # Give draining hex the volume of water it receives from this hex
+        drainingHex.quantityDrained += nextHex.waterReceived + nextHex.quantityDrained
+        remainingInflows[drainingHex.hexIndex] -= 1
+        if not remainingInflows[drainingHex.hexIndex]:
+            readyHexes.append(drainingHex)
+
+# Priority-flood of a dict of land hexes from the coast inwards, lowest first. Returns each hex's fill level,
+#  the centre altitude water would pond to there before spilling to the sea, and the hex the flood reached
+#  it from, which is the next step on its spill route. Both are keyed by hexIndex. Hexes that no flood
+#  from water reaches are left out.
+def floodFromCoast(hexes):
+    fillLevels = dict()
+    floodParents = dict()
+    floodQueue = []
+    queueOrder = count()
+    for nextHex in hexes.values():
+        for neighbour in nextHex.getNeighbours():
+            if neighbour.water and not neighbour.hexIndex in hexes:
+                fillLevels[nextHex.hexIndex] = getDrainageAltitude(nextHex)
+                floodParents[nextHex.hexIndex] = neighbour
+                heapq.heappush(floodQueue, (fillLevels[nextHex.hexIndex], next(queueOrder), nextHex))
+                break
+    while floodQueue:
+        fillLevel, _, nextHex = heapq.heappop(floodQueue)
+        for neighbour in nextHex.getNeighbours():
+            if neighbour.hexIndex in hexes and not neighbour.hexIndex in fillLevels:
+                fillLevels[neighbour.hexIndex] = max(getDrainageAltitude(neighbour), fillLevel)
+                floodParents[neighbour.hexIndex] = nextHex
+                heapq.heappush(floodQueue, (fillLevels[neighbour.hexIndex], next(queueOrder), neighbour))
+    return fillLevels, floodParents
+
+# hexIndices of the depressions worth keeping as lakes. Depressions are groups of touching hexes that the
+#  flood fills above their altitude, and are kept when at least minDepth deep or at least minArea hexes.
+def findLakeHexes(hexes, fillLevels, minDepth, minArea):
+    lakeHexes = set()
+    visitedHexes = set()
+    for hexIndex, nextHex in hexes.items():
+        if hexIndex in visitedHexes or not fillLevels.get(hexIndex, float('-inf')) > getDrainageAltitude(nextHex):
+            continue
+        depressionHexes = [hexIndex]
+        depth = 0
+        visitedHexes.add(hexIndex)
+        unexploredHexes = [nextHex]
+        while unexploredHexes:
+            depressionHex = unexploredHexes.pop()
+            depth = max(depth, fillLevels[depressionHex.hexIndex] - getDrainageAltitude(depressionHex))
+            for neighbour in depressionHex.getNeighbours():
+                if neighbour.hexIndex in hexes and not neighbour.hexIndex in visitedHexes and fillLevels.get(neighbour.hexIndex, float('-inf')) > getDrainageAltitude(neighbour):
+                    visitedHexes.add(neighbour.hexIndex)
+                    depressionHexes.append(neighbour.hexIndex)
+                    unexploredHexes.append(neighbour)
+        if depth >= minDepth or len(depressionHexes) >= minArea:
+            lakeHexes.update(depressionHexes)
+    return lakeHexes
+
+def setDrainingNeighbour(hexagon, drainingHex):
+    if hexagon.drainingNeighbour and hexagon.drainingNeighbour is not hexagon:
+        hexagon.drainingNeighbour.drainedNeighbours = tuple(drainedHex for drainedHex in hexagon.drainingNeighbour.drainedNeighbours if drainedHex is not hexagon)
+    hexagon.drainingNeighbour = drainingHex
+    drainingHex.drainedNeighbours += (hexagon,)
+
+# Breach a sink by draining it along its spill route, found by floodFromCoast, until the route drops below the
+#  sink's fill level or meets water, a lake or a route breached before. Every hex draining downhill from there
+#  stays below that level, so no drainage cycles are made. Returns the hex left draining into water, if any.
+def breachSink(sinkHex, fillLevels, floodParents, lakeHexes, breachedHexes):
+    spillLevel = fillLevels[sinkHex.hexIndex]
+    currentHex = sinkHex
+    while not currentHex.hexIndex in breachedHexes:
+        breachedHexes.add(currentHex.hexIndex)
+        nextHex = floodParents[currentHex.hexIndex]
+        setDrainingNeighbour(currentHex, nextHex)
+        if nextHex.water:
+            return currentHex
+        if fillLevels[nextHex.hexIndex] < spillLevel or nextHex.hexIndex in lakeHexes:
+            break
+        currentHex = nextHex
+    return None
+
+# A hex followed by every hex upstream of it, depth first, found without recursion
 def findHexesDrainedAbove(hexagon):
-    if hexagon.drainedNeighbours:
-        for nextHex in hexagon.drainedNeighbours:
-            hexagon.hexesDrainedAbove.extend(findHexesDrainedAbove(nextHex))
-    return [hexagon] + hexagon.hexesDrainedAbove
+    drainedHexes = []
+    unvisitedHexes = [hexagon]
+    while unvisitedHexes:
+        nextHex = unvisitedHexes.pop()
+        drainedHexes.append(nextHex)
+        unvisitedHexes.extend(reversed(nextHex.drainedNeighbours))
+    return drainedHexes
 
 def getDrainageRoutePoints(riverPoints, hexagon, minHexesDrainedAbove):
     if not hexagon.drainingNeighbour:
         # Calculate drainage neighbour if not already known
         findDrainingNeighbour(hexagon)
-    if len(hexagon.hexesDrainedAbove) >= minHexesDrainedAbove:
+    if hexagon.upstreamCount >= minHexesDrainedAbove:
         # Drainage to lowest point in current hex
         riverPoints.extend(hexagon.getCentreCoordinates())
         riverPoints.extend(hexagon.lowestPoint.getCoords())
@@ -111,7 +273,7 @@ def drawDrainageRoute(hexagon, drainageRouteColor=(1.0,0,0,1), sinkColor=(0,1.0,
     if not hexagon.drainingNeighbour:
         # Calculate drainage neighbour if not already known
         findDrainingNeighbour(hexagon)
-    if len(hexagon.hexesDrainedAbove) >= minHexesDrainedAbove:
+    if hexagon.upstreamCount >= minHexesDrainedAbove:
         if hexagon.drainingNeighbour == hexagon or (drawMouthsAsSinks and not hexagon.drainingNeighbour.land):
             # Draw a square to indicate sink
             drawUtils.drawSquare([hexagon.centre.x, hexagon.centre.y], 4, sinkColor)
@@ -145,7 +307,7 @@ def drawVertexDrainageRoute(hexagon, drainageRouteColor=(1.0,0,0,1), sinkColor=(
                         # Has reached a water body
                         coastal = True
                 # Provide option to run to centre of neighbouring hex if preferable
-                for neighbouringHex in lowestPoint.surroundingHexes.values():
+                for neighbouringHex in lowestPoint.surroundingHexes:
                     if neighbouringHex.centre.altitude:
                         # If a hex centre is even just equal to current point, it is preferable
                         #  this deals with the unlikely case of flat hexagons, incorporating all drainage that terminates on perimeter
@@ -206,7 +368,7 @@ def drawPerimeterDrainageRoutes(hexagon, drainageRouteColor=(1.0,0,0,1), sinkCol
                     else:
                         # This neighbour is the drainage neighbour
                         point.drainingNeighbour = chosenPoint
-                        chosenPoint.drainedNeighbours.append(point)
+                        chosenPoint.drainedNeighbours += (point,)
                         # Draw drainage route
                         drawUtils.drawArrow([point.x, point.y], [chosenPoint.x, chosenPoint.y], drainageRouteColor)
             else:
@@ -1,42 +1,32 @@
 import math
-import pyglet
 import random
 
-class Vertex():
-    def __init__(self, coordinates, hexes=[], maxJitter=0 ):
-        self.id = next(vertexIdGen)
-        self.x = coordinates[0] + random.uniform(-maxJitter, maxJitter)
-        self.y = coordinates[1] + random.uniform(-maxJitter, maxJitter)
-        self.surroundingHexes = dict()
-        self.neighbouringVertices = []
-        self.addHexNeighbours(hexes)
-        self.altitude = None
-        # Closest coastal vertex can be found by hexRegion.closestBorderVertex[ point.id ]
-        self.directionToCoast = False
-        # Neighbouring vertex which is drained into from this vertex
-        self.drainingNeighbour = False
-        # Neighbouring vertices which drain into this vertex
-        self.drainedNeighbours = []
-        self.minBorderDistance = False
+import lazyimport
+
+pyglet = lazyimport.LazyModule("pyglet")
+
+# Behaviour shared by vertices and the array grid's vertex views, with slots for the state both keep on
+#  the object. Coordinates, altitude and neighbours are held by each subclass.
+class BaseVertex():
+    __slots__ = ('id', 'directionToCoast', 'drainingNeighbour', 'drainedNeighbours', 'minBorderDistance')
 
     def addHexNeighbours(self, hexes):
         for nextHex in hexes:
             # Only add hex if it isn't already included
-            if not nextHex.hexIndex in self.surroundingHexes:
-                self.surroundingHexes[len(self.surroundingHexes)] = nextHex
+            if not nextHex in self.surroundingHexes:
+                self.surroundingHexes += (nextHex,)
 
     def addVertexNeighbour(self, newVertex):
-        for neighbour in self.neighbouringVertices:
-            # Prevent a vertex from being added multiple times
-            if neighbour == newVertex:
-                return False
-        self.neighbouringVertices.append(newVertex)
+        # Prevent a vertex from being added multiple times
+        if newVertex in self.neighbouringVertices:
+            return False
+        self.neighbouringVertices += (newVertex,)
         # Ensure reciprocal relationship
         newVertex.addVertexNeighbour(self)
         return True
 
     def isByWater(self):
-        for nextHex in self.surroundingHexes.values():
+        for nextHex in self.surroundingHexes:
             if nextHex.water:
                 return True
         return False
@@ -53,6 +43,27 @@ class Vertex():
             ('v2f', (self.x, self.y))
         )
 
+class Vertex(BaseVertex):
+    # Slots avoid a per-vertex __dict__; a world holds several vertices per hex
+    __slots__ = ('x', 'y', 'surroundingHexes', 'neighbouringVertices', 'altitude')
+
+    def __init__(self, coordinates, hexes=(), maxJitter=0 ):
+        self.id = next(vertexIdGen)
+        self.x = coordinates[0] + random.uniform(-maxJitter, maxJitter)
+        self.y = coordinates[1] + random.uniform(-maxJitter, maxJitter)
+        # A vertex is surrounded by at most 3 hexes and has at most 3 perimeter neighbours
+        self.surroundingHexes = ()
+        self.neighbouringVertices = ()
+        self.addHexNeighbours(hexes)
+        self.altitude = None
+        # Closest coastal vertex can be found by hexRegion.closestBorderVertex[ point.id ]
+        self.directionToCoast = False
+        # Neighbouring vertex which is drained into from this vertex
+        self.drainingNeighbour = False
+        # Neighbouring vertices which drain into this vertex
+        self.drainedNeighbours = ()
+        self.minBorderDistance = False
+
 def idGenerator():
     i = 0
     while True:
@@ -176,7 +187,7 @@ class SpatialGrid():
         closestPerimeterVertex, perimeterMinDist, closestCentreVertex, centreMinDist = self.findNearestVertex(x, y)
 
         if closestCentreVertex and closestCentreVertex.surroundingHexes:
-            closestHex = closestCentreVertex.surroundingHexes.values()[0]
+            closestHex = closestCentreVertex.surroundingHexes[0]
 
         if perimeterMinDist >= centreMinDist:
             closestVertex = closestCentreVertex
@@ -212,4 +223,53 @@ class SpatialGrid():
         pyglet.gl.glColor4f(1.0, 0.0, 0.2, 0.2)
         pyglet.graphics.draw(vertCount, pyglet.gl.GL_POINTS,
             ('v2f', verts)
-        )
\ No newline at end of file
+        )
+
+# Points bucketed into square cells of a fixed size, keyed by id. Unlike SpatialGrid it has no fixed bounds
+#  and points can be removed, so it can follow a set of points that changes a few at a time.
+class PointBuckets():
+    def __init__(self, cellSize, points=()):
+        self.cellSize = float(cellSize)
+        self.cells = dict()
+        # Bounds of the cells ever occupied, which only grow
+        self.minCell = None
+        self.maxCell = None
+        for point in points:
+            self.add(point)
+
+    def getCell(self, x, y):
+        return (int(math.floor(x / self.cellSize)), int(math.floor(y / self.cellSize)))
+
+    def add(self, point):
+        cell = self.getCell(point.x, point.y)
+        self.cells.setdefault(cell, dict())[point.id] = point
+        if self.minCell is None:
+            self.minCell = self.maxCell = cell
+        else:
+            self.minCell = (min(self.minCell[0], cell[0]), min(self.minCell[1], cell[1]))
+            self.maxCell = (max(self.maxCell[0], cell[0]), max(self.maxCell[1], cell[1]))
+
+    def remove(self, point):
+        cell = self.getCell(point.x, point.y)
+        bucket = self.cells.get(cell)
+        if bucket is not None:
+            bucket.pop(point.id, None)
+            if not bucket:
+                del self.cells[cell]
+
+    # Points in a cell, keyed by id
+    def getCellPoints(self, cell):
+        return self.cells.get(cell, {})
+
+    def isCellInBounds(self, cell):
+        return self.minCell is not None and self.minCell[0] <= cell[0] <= self.maxCell[0] and self.minCell[1] <= cell[1] <= self.maxCell[1]
+
+# Cells on the square ring the given number of cells out from a cell
+def getRingCells(xIndex, yIndex, ring):
+    if ring == 0:
+        return [(xIndex, yIndex)]
+    cells = [(xIndex + offset, yIndex - ring) for offset in range(-ring, ring+1)]
+    cells.extend((xIndex + offset, yIndex + ring) for offset in range(-ring, ring+1))
+    cells.extend((xIndex - ring, yIndex + offset) for offset in range(-ring+1, ring))
+    cells.extend((xIndex + ring, yIndex + offset) for offset in range(-ring+1, ring))
+    return cells
@@ -0,0 +1,146 @@
+import lazyimport
+
+np = lazyimport.LazyModule("numpy")
+
+#
+# Half-edge index over a polygon mesh such as the hex grid. Face f's i-th
+# half-edge is edge f*k + i, running from its i-th vertex to its (i+1)-th,
+# so faces must list their vertices in a consistent winding order. Next,
+# twin, face and origin pointers are integer arrays, and a twin of -1 marks
+# a half-edge on the mesh boundary. Walking any edge sequence is then a
+# matter of following array entries.
+#
+
+class HalfEdgeMesh():
+    # faceVertices is a (faces, k) array of vertex indices, in winding order
+    def __init__(self, faceVertices):
+        faceVertices = np.asarray(faceVertices, dtype=np.int64).reshape(len(faceVertices), -1)
+        self.totalFaces, self.edgesPerFace = faceVertices.shape
+        self.totalVertices = int(faceVertices.max()) + 1 if faceVertices.size else 0
+        edges = np.arange(faceVertices.size, dtype=np.int64)
+        self.origin = faceVertices.ravel()
+        self.face = edges // self.edgesPerFace
+        self.next = self.face * self.edgesPerFace + (edges + 1) % self.edgesPerFace
+        self.prev = self.face * self.edgesPerFace + (edges - 1) % self.edgesPerFace
+        self.twin = self.findTwins()
+        self.vertexEdges = self.findVertexEdges()
+        # Plain lists of the pointers, for walks that step one edge at a time
+        self.nextList = self.next.tolist()
+        self.twinList = self.twin.tolist()
+        self.faceList = self.face.tolist()
+        self.originList = self.origin.tolist()
+
+    def destination(self, edge):
+        return self.origin[self.next[edge]]
+
+    # A half-edge's twin runs between the same vertices in the opposite direction
+    def findTwins(self):
+        twin = np.full(len(self.origin), -1, dtype=np.int64)
+        if not len(self.origin):
+            return twin
+        destinations = self.origin[self.next]
+        edgeKeys = self.origin * self.totalVertices + destinations
+        reversedKeys = destinations * self.totalVertices + self.origin
+        order = np.argsort(edgeKeys, kind='stable')
+        positions = np.minimum(np.searchsorted(edgeKeys[order], reversedKeys), len(order) - 1)
+        hasTwin = edgeKeys[order][positions] == reversedKeys
+        twin[hasTwin] = order[positions[hasTwin]]
+        return twin
+
+    # Half-edges leaving each vertex, as a (vertices, most edges at a vertex) array padded with -1
+    def findVertexEdges(self):
+        order = np.argsort(self.origin, kind='stable')
+        counts = np.bincount(self.origin, minlength=self.totalVertices)
+        vertexEdges = np.full((self.totalVertices, max(int(counts.max()) if len(counts) else 0, 1)), -1, dtype=np.int64)
+        starts = np.cumsum(counts) - counts
+        slots = np.arange(len(order)) - np.repeat(starts, counts)
+        vertexEdges[self.origin[order], slots] = order
+        return vertexEdges
+
+    # Whether a half-edge lies on the border of a set of faces, given by isInside(face)
+    def isBorderEdge(self, edge, isInside):
+        twin = self.twinList[edge]
+        return isInside(self.faceList[edge]) and (twin == -1 or not isInside(self.faceList[twin]))
+
+    # Border half-edge of a set of faces leaving a vertex, or -1 if the vertex is not on that border
+    def findBorderEdgeFrom(self, vertex, isInside):
+        for edge in self.vertexEdges[vertex].tolist():
+            if edge != -1 and self.isBorderEdge(edge, isInside):
+                return edge
+        return -1
+
+    # Border half-edges of a set of faces, in order around the loop containing startEdge. The faces are
+    #  given by isInside(face), with None meaning the whole mesh. Each step rotates about the current
+    #  edge's destination until it reaches the next border edge, so the walk is linear in the loop's length.
+    def traceBoundary(self, startEdge, isInside=None):
+        nextList, twinList, faceList = self.nextList, self.twinList, self.faceList
+        loop = [startEdge]
+        edge = startEdge
+        while True:
+            edge = nextList[edge]
+            while twinList[edge] != -1 and (isInside is None or isInside(faceList[twinList[edge]])):
+                edge = nextList[twinList[edge]]
+            if edge == startEdge:
+                return loop
+            loop.append(edge)
+
+    # All loops of the mesh boundary, each a list of half-edges
+    def findBoundaryLoops(self):
+        visited = set()
+        loops = []
+        for edge in np.flatnonzero(self.twin == -1).tolist():
+            if not edge in visited:
+                loop = self.traceBoundary(edge)
+                visited.update(loop)
+                loops.append(loop)
+        return loops
+
+# Half-edge mesh with hexagons as faces and their points as vertices
+class HexMesh(HalfEdgeMesh):
+    def __init__(self, faceVertices, faceHexIndices, vertexPoints=None, vertexIndices=None, grid=None):
+        HalfEdgeMesh.__init__(self, faceVertices)
+        # hexIndex of each face, and the faces keyed by hexIndex
+        self.faceHexIndices = faceHexIndices
+        self.hexFaces = dict((hexIndex, face) for face, hexIndex in enumerate(faceHexIndices))
+        # Points are either listed, with a map from point id to vertex, or are the grid's vertex views
+        self.vertexPoints = vertexPoints
+        self.vertexIndices = vertexIndices
+        self.grid = grid
+
+    def getVertexPoint(self, vertex):
+        if self.grid:
+            return self.grid.getVertexView(vertex)
+        return self.vertexPoints[vertex]
+
+    # Vertex index of a point, or -1 if the point is not in the mesh
+    def getVertexIndex(self, point):
+        if self.grid:
+            return point.id
+        return self.vertexIndices.get(point.id, -1)
+
+    # Function telling whether a face's hex is in a dict of hexes keyed by hexIndex
+    def createHexMembershipTest(self, hexes):
+        faceHexIndices = self.faceHexIndices
+        return lambda face: faceHexIndices[face] in hexes
+
+# Hex mesh of a collection of hexagon objects
+def createHexMesh(hexes):
+    vertexIndices = dict()
+    vertexPoints = []
+    faceVertices = []
+    faceHexIndices = []
+    for nextHex in hexes:
+        faceRow = []
+        for point in nextHex.points:
+            if not point.id in vertexIndices:
+                vertexIndices[point.id] = len(vertexPoints)
+                vertexPoints.append(point)
+            faceRow.append(vertexIndices[point.id])
+        faceVertices.append(faceRow)
+        faceHexIndices.append(nextHex.hexIndex)
+    return HexMesh(np.array(faceVertices, dtype=np.int64).reshape(len(faceVertices), 6), faceHexIndices, vertexPoints, vertexIndices)
+
+# Hex mesh of an array-backed hexgrid.HexGrid, built straight from its arrays
+def createGridMesh(grid):
+    faceHexIndices = [tuple(hexIndex) for hexIndex in grid.hexIndices.tolist()]
+    return HexMesh(grid.hexVertices, faceHexIndices, grid=grid)
@@ -0,0 +1,90 @@
+import time
+
+import lazyimport
+
+np = lazyimport.LazyModule("numpy")
+
+#
+# Dense heightmaps of a world's altitudes, for tools that work on rasters
+# rather than hexes. Each hex is split into the six triangles it is drawn
+# with, between its centre and each perimeter edge, and every pixel takes
+# the barycentric interpolation of the altitudes at the corners of the
+# triangle containing it. Triangles are rasterised together in chunks, each
+# chunk testing all the pixels in its triangles' bounding boxes at once.
+#
+
+# Candidate pixels tested at once, bounding the memory of temporaries
+HEIGHTFIELD_CHUNK_PIXELS = 1 << 20
+
+# Corner coordinates (m, 3, 2) and altitudes (m, 3) of every hex's triangles, six per hex in grid order.
+#  Triangle j of a hex joins its centre to the edge from points[j] to points[j+1]. Altitudes never
+#  assigned, such as those of water, are NaN.
+def getWorldTriangles(world):
+    centres, points = world.getHexGeometry()
+    if world.grid:
+        grid = world.grid
+        pointAltitudes = grid.vertexAltitudes[grid.hexVertices]
+        centreAltitudes = grid.vertexAltitudes[grid.centreVertexIndex(np.arange(grid.numHexes))]
+    else:
+        hexList = world.getHexList()
+        pointAltitudes = np.array([[np.nan if point.altitude is None else point.altitude for point in nextHex.points] for nextHex in hexList], dtype=np.float64)
+        centreAltitudes = np.array([np.nan if nextHex.centre.altitude is None else nextHex.centre.altitude for nextHex in hexList], dtype=np.float64)
+    pointAltitudes = pointAltitudes.reshape(len(centres), -1)
+    nextPoints = np.roll(np.arange(pointAltitudes.shape[1]), -1)
+    triangles = np.stack((np.repeat(centres[:,None,:], points.shape[1], axis=1), points, points[:,nextPoints]), axis=2).reshape(-1, 3, 2)
+    altitudes = np.stack((np.repeat(centreAltitudes[:,None], pointAltitudes.shape[1], axis=1), pointAltitudes, pointAltitudes[:,nextPoints]), axis=2).reshape(-1, 3)
+    return triangles, altitudes
+
+# (height, width) array of the world's altitudes, indexed [y][x] like the land mask and noise arrays, with
+#  pixel (col, row) centred on world coordinates ((col+0.5)*worldWidth/width, (row+0.5)*worldHeight/height).
+#  Unassigned altitudes and pixels outside every hex take missingAltitude.
+def createHeightfield(world, width, height, missingAltitude=0.0, pixelsPerChunk=HEIGHTFIELD_CHUNK_PIXELS):
+    t0 = time.time()
+    triangles, altitudes = getWorldTriangles(world)
+    heightfield = rasteriseTriangles(triangles, np.where(np.isnan(altitudes), missingAltitude, altitudes), width, height,
+        float(width)/world.worldWidth, float(height)/world.worldHeight, missingAltitude, pixelsPerChunk)
+    print("Created %dx%d heightfield from %d triangles in %f" % (width, height, len(triangles), time.time()-t0))
+    return heightfield
+
+# Rasterise triangles given in world coordinates, scaled by pixelsPerUnitX/Y into a (height, width) array,
+#  interpolating per-corner values across each triangle
+def rasteriseTriangles(triangles, values, width, height, pixelsPerUnitX, pixelsPerUnitY, fillValue=0.0, pixelsPerChunk=HEIGHTFIELD_CHUNK_PIXELS):
+    raster = np.full((height, width), fillValue, dtype=np.float64)
+    # Pixel coordinates, with pixel centres at whole numbers
+    xs = triangles[:,:,0] * pixelsPerUnitX - 0.5
+    ys = triangles[:,:,1] * pixelsPerUnitY - 0.5
+    # Triangles with no area, e.g. clipped at the edge of the world, cover no pixels
+    denominators = (ys[:,1] - ys[:,2]) * (xs[:,0] - xs[:,2]) + (xs[:,2] - xs[:,1]) * (ys[:,0] - ys[:,2])
+    # Range of pixels in each triangle's bounding box
+    colStarts = np.clip(np.ceil(xs.min(axis=1)), 0, width).astype(np.int64)
+    colEnds = np.clip(np.floor(xs.max(axis=1)) + 1, 0, width).astype(np.int64)
+    rowStarts = np.clip(np.ceil(ys.min(axis=1)), 0, height).astype(np.int64)
+    rowEnds = np.clip(np.floor(ys.max(axis=1)) + 1, 0, height).astype(np.int64)
+    boxWidths = np.maximum(colEnds - colStarts, 0)
+    pixelCounts = np.where(denominators != 0, boxWidths * np.maximum(rowEnds - rowStarts, 0), 0)
+    # Split the triangles into consecutive chunks of about pixelsPerChunk candidate pixels
+    firstPixels = np.cumsum(pixelCounts) - pixelCounts
+    chunkIds = firstPixels // max(pixelsPerChunk, 1)
+    chunkStarts = np.concatenate(([0], np.flatnonzero(np.diff(chunkIds)) + 1, [len(triangles)]))
+    for start, end in zip(chunkStarts[:-1].tolist(), chunkStarts[1:].tolist()):
+        counts = pixelCounts[start:end]
+        if not counts.any():
+            continue
+        # One entry per candidate pixel: its triangle, and its position in that triangle's bounding box
+        candidateTriangles = np.repeat(np.arange(start, end), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cols = colStarts[candidateTriangles] + offsets % boxWidths[candidateTriangles]
+        rows = rowStarts[candidateTriangles] + offsets // boxWidths[candidateTriangles]
+        triangleXs = xs[candidateTriangles]
+        triangleYs = ys[candidateTriangles]
+        dx = cols - triangleXs[:,2]
+        dy = rows - triangleYs[:,2]
+        denominator = denominators[candidateTriangles]
+        weight0 = ((triangleYs[:,1] - triangleYs[:,2]) * dx + (triangleXs[:,2] - triangleXs[:,1]) * dy) / denominator
+        weight1 = ((triangleYs[:,2] - triangleYs[:,0]) * dx + (triangleXs[:,0] - triangleXs[:,2]) * dy) / denominator
+        weight2 = 1 - weight0 - weight1
+        # Pixels on an edge shared by two triangles get the same value from either
+        inside = (weight0 >= -1e-9) & (weight1 >= -1e-9) & (weight2 >= -1e-9)
+        triangleValues = values[candidateTriangles[inside]]
+        raster[rows[inside], cols[inside]] = weight0[inside] * triangleValues[:,0] + weight1[inside] * triangleValues[:,1] + weight2[inside] * triangleValues[:,2]
+    return raster
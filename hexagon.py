@@ -1,130 +1,26 @@
-import pyglet
-from pyglet.gl import *
-from pyglet import image
 import random
 import copy
 from itertools import chain
 import struct
 
 import graph
-import drawUtils
+import drainage
 import math
+import lazyimport
 
-class Hexagon():
-    def __init__(self, centreCoordinates, radius=20, hexIndex=False, jitterStrength=False, existingNeighbours=(None,None,None), isBorderHex=False):
-        self.hexIndex = hexIndex
-        self.centre = graph.Vertex( coordinates=centreCoordinates, hexes=[self])
-        #print("Creating hex with centre: %f, %f" % (self.centre.x, self.centre.y))
-        self.radius = radius
-        # The innerRadius = (sqrt(3) * self.radius) / 2 = (1.73205080757 / 2) * self.radius = 0.866025403785 * self.radius
-        self.innerRadius = 0.8660254 * self.radius # aka hexagon width
-
-        self.points = [None for a in range(6)]
-        self.lowestPoint = False
-        self.neighbours = dict()
-        self.createVertices(existingNeighbours, jitterStrength, isBorderHex)
-        # Hex that drains from this one
-        self.drainingNeighbour = False
-        # Hexes which drain into this one
-        self.drainedNeighbours = []
-        self.hexesDrainedAbove = []
-        self.waterReceived = 1
-        # Amount of water drained
-        self.quantityDrained = 0
-        self.fillColor = False #(random.random(),random.random(),random.random(),0.5)
-        self.land = False
-        # Nearest distance to border is from hex point closest to border
-        self.shortestDistanceToBorder = False
-        self.nearestBorderVertex = False
-        # Furthest distance to border is furthest relative to other hex points' nearest border
-        self.furthestDistanceToBorder = False
-        self.water = False
-        if jitterStrength and not isBorderHex:
-            self.calculateCentrePoint()
-        self.renderForDiagnostics = False
-    
-    def createVertices(self, existingNeighbours, jitterStrength, isBorderHex):
-        southeastNeighbour = existingNeighbours[0]
-        southwestNeighbour = existingNeighbours[1]
-        westNeighbour = existingNeighbours[2]
+pyglet = lazyimport.LazyModule("pyglet")
 
-        radius = self.radius
-        innerRadius = self.innerRadius
+# Behaviour shared by hexagons and the array grid's hex views, with slots for the generation state
+#  both keep on the object. Geometry (centre, points and neighbours) is held by each subclass.
+class BaseHexagon():
+    # Slots avoid a per-hex __dict__, which dominates memory on large grids
+    __slots__ = ('hexIndex', 'radius', 'innerRadius', 'lowestPoint',
+        'drainingNeighbour', 'drainedNeighbours', 'upstreamCount', 'waterReceived', 'quantityDrained',
+        'fillColor', 'land', 'shortestDistanceToBorder', 'nearestBorderVertex', 'furthestDistanceToBorder',
+        'water', 'renderForDiagnostics')
 
-        maxJitter = 0
-        if not isBorderHex:
-            maxJitter = self.radius*jitterStrength
-
-        x = self.centre.x
-        y = self.centre.y
-        #N, Top point
-        self.points[0] = ( graph.Vertex( coordinates=(x, y+radius), hexes=[self], maxJitter=maxJitter ))
-        #NE
-        self.points[1] = ( graph.Vertex( coordinates=(x+innerRadius, y+(radius/2)), hexes=[self], maxJitter=maxJitter ))
-        #SE
-        if southeastNeighbour:
-            ### self SE point is seNeighbour's N point
-            self.points[2] = southeastNeighbour.points[0]
-            self.points[2].addHexNeighbours([self])
-            ### self S point is seNeighbour's NW point
-            self.points[3] = southeastNeighbour.points[5]
-            self.points[3].addHexNeighbours([self])
-            ## Log neighbour relationship
-            self.neighbours[2] = southeastNeighbour
-            southeastNeighbour.neighbours[5] = self
-            # Records points as neighbours to each other if not already
-            #  reciprocal relationship is automatically handled
-            self.points[2].addVertexNeighbour(self.points[3])
-        else:
-            #print("No SE neighbour for hex %s." % (str(self.hexIndex)))
-            self.points[2] = ( graph.Vertex( coordinates=(self.centre.x+self.innerRadius, self.centre.y-(self.radius/2)), hexes=[self], maxJitter=maxJitter ))    
-
-        #SW
-        if southwestNeighbour:
-            ## Adopt SW neighbour's points
-            ### self SW point is neighbour's N point
-            self.points[4] = southwestNeighbour.points[0]
-            self.points[4].addHexNeighbours([self])
-            ## Log neighbour relationship
-            self.neighbours[3] = southwestNeighbour
-            southwestNeighbour.neighbours[0] = self
-            # If no seNeighbour existed, use swNeighbour to set southern vertex
-            if not southeastNeighbour:
-                self.points[3] = southwestNeighbour.points[1]
-                self.points[3].addHexNeighbours([self])
-            # Records points as neighbours to each other if not already
-            #  reciprocal relationship is automatically handled
-            self.points[3].addVertexNeighbour(self.points[4])
-        else:
-            # No swNeighbout guarantees no w neighbour either, so vertex must be created
-            #print("No SW neighbour for hex %s." % (str(self.hexIndex)))
-            self.points[4] = ( graph.Vertex( coordinates=(self.centre.x-self.innerRadius, self.centre.y-(self.radius/2)), hexes=[self], maxJitter=maxJitter ))
-
-        #S
-        if not self.points[3]:
-            # if it hasn't be set by se or sw neigbours
-            self.points[3] = ( graph.Vertex( coordinates=(x, y-radius), hexes=[self], maxJitter=maxJitter ))
-
-        #NW
-        if westNeighbour:
-            ## Adopt W neighbour's points
-            ### self NW point is neighbour's NE point
-            self.points[5] = westNeighbour.points[1]
-            self.points[5].addHexNeighbours([self])
-            ## Log neighbour relationship
-            self.neighbours[4] = westNeighbour
-            westNeighbour.neighbours[1] = self
-            ### self SW point is neighbour's SE point
-            # This may have already been added from the SW neighbour
-            if not southwestNeighbour:
-                self.points[4] = westNeighbour.points[2]
-                self.points[4].addHexNeighbours([self])
-            # Records points as neighbours to each other if not already
-            #  reciprocal relationship is automatically handled
-            self.points[4].addVertexNeighbour(self.points[5])
-        else:
-            #print("No W neighbour for hex %s." % (str(self.hexIndex)))
-            self.points[5] = ( graph.Vertex( coordinates=(self.centre.x-self.innerRadius, self.centre.y+(self.radius/2)), hexes=[self], maxJitter=maxJitter ))
+    def getNeighbours(self):
+        return [neighbour for neighbour in self.neighbours if neighbour]
 
     def getSuccessivePoint(self, v0):
         #print("getSuccessivePoint calling get point index")
@@ -375,9 +271,8 @@ class Hexagon():
                 #image_data = maskImageData.get_region(attenuatedX, attenuatedY, 1, 1).get_image_data()
                 # Extract intensity info
                 #data = image_data.get_data('I', 1)
-                data = maskImageData[i]
                 # Convert from byte to int
-                data = struct.unpack('<B', data)[0]
+                data = struct.unpack_from('<B', maskImageData, i)[0]
 
                 if data > 0:
                 #   print("Vote")
@@ -400,6 +295,12 @@ class Hexagon():
                 return True
         return False
 
+    # Hexes upstream of this one, in depth-first order. The list is built from drainedNeighbours on each access
+    #  rather than stored, so read upstreamCount when only their number is needed.
+    @property
+    def hexesDrainedAbove(self):
+        return drainage.findHexesDrainedAbove(self)[1:]
+
     def findLowestPoint(self, forceRecalculation=False):
         # Check if it has already been calculated
         if not self.lowestPoint or forceRecalculation:
@@ -414,3 +315,124 @@ class Hexagon():
     def isPointInsideHexRadius(self, x, y):
         distSq = (self.centre.x - x)**2 + (self.centre.y - y)**2
         return distSq <= self.radius**2
+
+# Hexagon of the object grid, holding its own centre vertex, perimeter points and neighbours
+class Hexagon(BaseHexagon):
+    __slots__ = ('centre', 'points', 'neighbours')
+
+    def __init__(self, centreCoordinates, radius=20, hexIndex=False, jitterStrength=False, existingNeighbours=(None,None,None), isBorderHex=False):
+        self.hexIndex = hexIndex
+        self.centre = graph.Vertex( coordinates=centreCoordinates, hexes=[self])
+        #print("Creating hex with centre: %f, %f" % (self.centre.x, self.centre.y))
+        self.radius = radius
+        # The innerRadius = (sqrt(3) * self.radius) / 2 = (1.73205080757 / 2) * self.radius = 0.866025403785 * self.radius
+        self.innerRadius = 0.8660254 * self.radius # aka hexagon width
+
+        self.points = [None for a in range(6)]
+        self.lowestPoint = False
+        # Neighbour i shares the edge points[i] -> points[i+1], None where no neighbour exists
+        self.neighbours = [None for a in range(6)]
+        self.createVertices(existingNeighbours, jitterStrength, isBorderHex)
+        # Hex that drains from this one
+        self.drainingNeighbour = False
+        # Hexes which drain into this one
+        self.drainedNeighbours = ()
+        # Number of hexes upstream, see drainage.accumulateFlow
+        self.upstreamCount = 0
+        self.waterReceived = 1
+        # Amount of water drained
+        self.quantityDrained = 0
+        self.fillColor = False #(random.random(),random.random(),random.random(),0.5)
+        self.land = False
+        # Nearest distance to border is from hex point closest to border
+        self.shortestDistanceToBorder = False
+        self.nearestBorderVertex = False
+        # Furthest distance to border is furthest relative to other hex points' nearest border
+        self.furthestDistanceToBorder = False
+        self.water = False
+        if jitterStrength and not isBorderHex:
+            self.calculateCentrePoint()
+        self.renderForDiagnostics = False
+    
+    def createVertices(self, existingNeighbours, jitterStrength, isBorderHex):
+        southeastNeighbour = existingNeighbours[0]
+        southwestNeighbour = existingNeighbours[1]
+        westNeighbour = existingNeighbours[2]
+
+        radius = self.radius
+        innerRadius = self.innerRadius
+
+        maxJitter = 0
+        if not isBorderHex:
+            maxJitter = self.radius*jitterStrength
+
+        x = self.centre.x
+        y = self.centre.y
+        #N, Top point
+        self.points[0] = ( graph.Vertex( coordinates=(x, y+radius), hexes=[self], maxJitter=maxJitter ))
+        #NE
+        self.points[1] = ( graph.Vertex( coordinates=(x+innerRadius, y+(radius/2)), hexes=[self], maxJitter=maxJitter ))
+        #SE
+        if southeastNeighbour:
+            ### self SE point is seNeighbour's N point
+            self.points[2] = southeastNeighbour.points[0]
+            self.points[2].addHexNeighbours([self])
+            ### self S point is seNeighbour's NW point
+            self.points[3] = southeastNeighbour.points[5]
+            self.points[3].addHexNeighbours([self])
+            ## Log neighbour relationship
+            self.neighbours[2] = southeastNeighbour
+            southeastNeighbour.neighbours[5] = self
+            # Records points as neighbours to each other if not already
+            #  reciprocal relationship is automatically handled
+            self.points[2].addVertexNeighbour(self.points[3])
+        else:
+            #print("No SE neighbour for hex %s." % (str(self.hexIndex)))
+            self.points[2] = ( graph.Vertex( coordinates=(self.centre.x+self.innerRadius, self.centre.y-(self.radius/2)), hexes=[self], maxJitter=maxJitter ))    
+
+        #SW
+        if southwestNeighbour:
+            ## Adopt SW neighbour's points
+            ### self SW point is neighbour's N point
+            self.points[4] = southwestNeighbour.points[0]
+            self.points[4].addHexNeighbours([self])
+            ## Log neighbour relationship
+            self.neighbours[3] = southwestNeighbour
+            southwestNeighbour.neighbours[0] = self
+            # If no seNeighbour existed, use swNeighbour to set southern vertex
+            if not southeastNeighbour:
+                self.points[3] = southwestNeighbour.points[1]
+                self.points[3].addHexNeighbours([self])
+            # Records points as neighbours to each other if not already
+            #  reciprocal relationship is automatically handled
+            self.points[3].addVertexNeighbour(self.points[4])
+        else:
+            # No swNeighbout guarantees no w neighbour either, so vertex must be created
+            #print("No SW neighbour for hex %s." % (str(self.hexIndex)))
+            self.points[4] = ( graph.Vertex( coordinates=(self.centre.x-self.innerRadius, self.centre.y-(self.radius/2)), hexes=[self], maxJitter=maxJitter ))
+
+        #S
+        if not self.points[3]:
+            # if it hasn't be set by se or sw neigbours
+            self.points[3] = ( graph.Vertex( coordinates=(x, y-radius), hexes=[self], maxJitter=maxJitter ))
+
+        #NW
+        if westNeighbour:
+            ## Adopt W neighbour's points
+            ### self NW point is neighbour's NE point
+            self.points[5] = westNeighbour.points[1]
+            self.points[5].addHexNeighbours([self])
+            ## Log neighbour relationship
+            self.neighbours[4] = westNeighbour
+            westNeighbour.neighbours[1] = self
+            ### self SW point is neighbour's SE point
+            # This may have already been added from the SW neighbour
+            if not southwestNeighbour:
+                self.points[4] = westNeighbour.points[2]
+                self.points[4].addHexNeighbours([self])
+            # Records points as neighbours to each other if not already
+            #  reciprocal relationship is automatically handled
+            self.points[4].addVertexNeighbour(self.points[5])
+        else:
+            #print("No W neighbour for hex %s." % (str(self.hexIndex)))
+            self.points[5] = ( graph.Vertex( coordinates=(self.centre.x-self.innerRadius, self.centre.y+(self.radius/2)), hexes=[self], maxJitter=maxJitter ))
\ No newline at end of file
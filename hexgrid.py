@@ -0,0 +1,286 @@
+import math
+import random
+
+import graph
+import hexagon
+import lazyimport
+
+np = lazyimport.LazyModule("numpy")
+
+#
+# HexGrid is an array-backed alternative to a grid of hexagon.Hexagon objects.
+# Vertex coordinates, altitudes, hex-to-vertex indices and hex-to-hex
+# neighbour indices are held in contiguous NumPy arrays. HexagonView and
+# VertexView objects give existing callers the familiar Hexagon/Vertex API
+# while reading and writing through to those arrays.
+#
+
+# Lattice offsets of perimeter points from a hex centre, in units of (innerRadius, radius/2).
+#  Order matches hexagon.Hexagon.points: N, NE, SE, S, SW, NW
+POINT_OFFSETS = ((0, 2), (1, 1), (1, -1), (0, -2), (-1, -1), (-1, 1))
+# Lattice offsets of neighbouring hex centres. Neighbour i shares the edge points[i] -> points[i+1]
+NEIGHBOUR_OFFSETS = ((1, 3), (2, 0), (1, -3), (-1, -3), (-2, 0), (-1, 3))
+# Order in which Hexagon.createVertices creates any points not adopted from neighbours
+POINT_CREATION_ORDER = (0, 1, 2, 4, 3, 5)
+
+class HexGrid():
+    def __init__(self, worldWidth, worldHeight, hexesInOddRow=10, jitterStrength=0.2):
+        self.worldWidth = worldWidth
+        self.worldHeight = worldHeight
+        self.hexesInOddRow = hexesInOddRow
+        self.jitterStrength = jitterStrength
+        # Width of hexagons is calculated from worldWidth, which then determines hex radius
+        self.hexWidth = float(self.worldWidth)/float(self.hexesInOddRow)
+        self.hexRadius = self.hexWidth / math.sqrt(3)
+        self.innerRadius = 0.8660254 * self.hexRadius
+        # Views are created on demand and cached so vertex and hex identity is stable
+        self.hexViews = dict()
+        self.vertexViews = dict()
+        self.buildGrid()
+
+    # Build vertex and hex arrays for the whole lattice at once, sharing perimeter points between neighbouring hexes
+    def buildGrid(self):
+        print("Creating array hex grid (hexesInOddRow: %d)" % (self.hexesInOddRow))
+        # Row heights accumulate exactly as in World.createHexGridFromPoints
+        rowCentreYs = []
+        hexCentreY = 0
+        while hexCentreY - self.hexRadius < self.worldHeight:
+            rowCentreYs.append(hexCentreY)
+            hexCentreY += self.hexRadius * 1.5
+        self.numRows = len(rowCentreYs)
+        rowCentreYs = np.array(rowCentreYs)
+        # One less hex on odd-numbered rows
+        hexesInRows = self.hexesInOddRow + 1 - np.arange(self.numRows)%2
+        self.rowStarts = np.concatenate(([0], np.cumsum(hexesInRows))).astype(np.int32)
+        self.numHexes = int(self.rowStarts[-1])
+
+        rows = np.repeat(np.arange(self.numRows, dtype=np.int32), hexesInRows)
+        cols = (np.arange(self.numHexes, dtype=np.int32) - self.rowStarts[rows]).astype(np.int32)
+        self.hexIndices = np.stack((cols, rows), axis=1)
+        # Offset each row to allow for tesselation
+        centreXs = cols*self.hexWidth + (rows%2)*(self.hexWidth/2)
+        centreYs = rowCentreYs[rows]
+        self.isBorderHex = (rows == 0) | (cols == 0) | (rows == hexesInRows[rows]) | (centreYs+(0.5*self.hexRadius) >= self.worldHeight)
+        hexMaxJitter = np.where(self.isBorderHex, 0.0, self.hexRadius*self.jitterStrength)
+
+        # Perimeter points are keyed on their unjittered lattice position, visited in the order
+        #  Hexagon.createVertices would create them so each vertex is owned by the first hex to reach it
+        creationOrder = np.array(POINT_CREATION_ORDER)
+        offsets = np.array(POINT_OFFSETS)[creationOrder]
+        latticeX = (2*cols + rows%2)[:,None] + offsets[:,0]
+        latticeY = (3*rows)[:,None] + offsets[:,1]
+        keys = (latticeY*(2*self.hexesInOddRow + 4) + latticeX + 1).ravel()
+        uniqueKeys, firstSeen, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        # Number vertices in the order they are first reached
+        seenOrder = np.argsort(firstSeen)
+        vertexNumbers = np.empty(len(uniqueKeys), dtype=np.int32)
+        vertexNumbers[seenOrder] = np.arange(len(uniqueKeys), dtype=np.int32)
+        self.numCorners = len(uniqueKeys)
+        self.hexVertices = np.empty((self.numHexes, 6), dtype=np.int32)
+        self.hexVertices[:, creationOrder] = vertexNumbers[inverse].reshape(self.numHexes, 6)
+
+        # Position and jitter each vertex according to the hex that owns it
+        ownerSlots = firstSeen[seenOrder]
+        owners = ownerSlots // 6
+        ownerOffsets = offsets[ownerSlots % 6]
+        cornerCoords = np.empty((self.numCorners, 2))
+        cornerCoords[:,0] = centreXs[owners] + ownerOffsets[:,0]*self.innerRadius
+        cornerCoords[:,1] = centreYs[owners] + ownerOffsets[:,1]*(self.hexRadius/2)
+        # Seed the array generator from random so world seeds stay reproducible
+        jitterGenerator = np.random.default_rng(random.getrandbits(64))
+        cornerCoords += jitterGenerator.uniform(-1.0, 1.0, (self.numCorners, 2)) * hexMaxJitter[owners][:,None]
+
+        # Centre vertices are stored after all perimeter vertices
+        self.vertexCoords = np.concatenate((cornerCoords, np.stack((centreXs, centreYs), axis=1)))
+        self.vertexAltitudes = np.full(len(self.vertexCoords), np.nan)
+        self.findHexNeighbours()
+        self.findVertexHexes()
+        # Jittered hexes have their centres moved to the average of their perimeter points
+        if self.jitterStrength:
+            self.calculateCentrePoints(~self.isBorderHex)
+        print("Created array hex grid with %d hexes and %d vertices." % (self.numHexes, self.numCorners))
+
+    # Fill hexNeighbours with the index of the hex across each edge, or -1 where there is none
+    def findHexNeighbours(self):
+        hexIdGrid = np.full((self.numRows, self.hexesInOddRow+1), -1, dtype=np.int32)
+        hexIdGrid[self.hexIndices[:,1], self.hexIndices[:,0]] = np.arange(self.numHexes, dtype=np.int32)
+        latticeX = 2*self.hexIndices[:,0] + self.hexIndices[:,1]%2
+        latticeY = 3*self.hexIndices[:,1]
+        self.hexNeighbours = np.full((self.numHexes, 6), -1, dtype=np.int32)
+        for i, offset in enumerate(NEIGHBOUR_OFFSETS):
+            rows = (latticeY + offset[1]) // 3
+            cols = (latticeX + offset[0] - rows%2) // 2
+            valid = (rows >= 0) & (rows < self.numRows) & (cols >= 0) & (cols <= self.hexesInOddRow)
+            self.hexNeighbours[valid, i] = hexIdGrid[rows[valid], cols[valid]]
+
+    # Fill vertexHexes with up to three hexes surrounding each perimeter vertex, in creation order
+    def findVertexHexes(self):
+        self.vertexHexes = np.full((self.numCorners, 3), -1, dtype=np.int32)
+        flatVertices = self.hexVertices.ravel()
+        # A stable sort keeps each vertex's hexes in index order, matching the order they adopt shared points
+        order = np.argsort(flatVertices, kind='stable')
+        sortedVertices = flatVertices[order]
+        groupStarts = np.searchsorted(sortedVertices, np.arange(self.numCorners))
+        slots = np.arange(len(order)) - groupStarts[sortedVertices]
+        self.vertexHexes[sortedVertices, slots] = order // 6
+
+    def centreVertexIndex(self, hexId):
+        return self.numCorners + hexId
+
+    def getCentreCoords(self):
+        return self.vertexCoords[self.numCorners:]
+
+    def calculateCentrePoints(self, hexMask=None):
+        hexIds = np.arange(self.numHexes) if hexMask is None else np.flatnonzero(hexMask)
+        pointCoords = self.vertexCoords[self.hexVertices[hexIds]]
+        # Sum points in perimeter order so centres match Hexagon.calculateCentrePoint exactly
+        coordSums = pointCoords[:,0]
+        for i in range(1, 6):
+            coordSums = coordSums + pointCoords[:,i]
+        self.vertexCoords[self.numCorners + hexIds] = coordSums / 6.0
+
+    # Shift out of bounds points of hexes on the edge of the grid to the world perimeter
+    def clipPointsToWorldDimensions(self):
+        cols = self.hexIndices[:,0]
+        rows = self.hexIndices[:,1]
+        lastCols = self.rowStarts[rows+1] - self.rowStarts[rows] - 1
+        edgeHexes = (rows == 0) | (rows == self.numRows-1) | (cols == 0) | (cols == lastCols)
+        points = np.unique(self.hexVertices[edgeHexes])
+        self.vertexCoords[points,0] = np.clip(self.vertexCoords[points,0], 0, self.worldWidth)
+        self.vertexCoords[points,1] = np.clip(self.vertexCoords[points,1], 0, self.worldHeight)
+        self.calculateCentrePoints(edgeHexes)
+
+    def getHexView(self, hexId):
+        view = self.hexViews.get(hexId)
+        if view is None:
+            view = HexagonView(self, hexId)
+            self.hexViews[hexId] = view
+        return view
+
+    def getVertexView(self, vertexIndex):
+        view = self.vertexViews.get(vertexIndex)
+        if view is None:
+            view = VertexView(self, vertexIndex)
+            self.vertexViews[vertexIndex] = view
+        return view
+
+    # Rows of hex views, in the same layout as World.hexGrid
+    def getHexRows(self):
+        return [[self.getHexView(hexId) for hexId in range(self.rowStarts[row], self.rowStarts[row+1])] for row in range(self.numRows)]
+
+#
+# Hexagon API over a single hex of a HexGrid. Geometry is read from the
+# grid arrays while per-hex generation state is held on the view itself.
+#
+class HexagonView(hexagon.BaseHexagon):
+    __slots__ = ('grid', 'hexId', '_points', '_neighbours')
+
+    def __init__(self, grid, hexId):
+        self.grid = grid
+        self.hexId = hexId
+        self.hexIndex = tuple(grid.hexIndices[hexId].tolist())
+        self.radius = grid.hexRadius
+        self.innerRadius = grid.innerRadius
+        self.lowestPoint = False
+        self.drainingNeighbour = False
+        self.drainedNeighbours = ()
+        self.upstreamCount = 0
+        self.waterReceived = 1
+        self.quantityDrained = 0
+        self.fillColor = False
+        self.land = False
+        self.shortestDistanceToBorder = False
+        self.nearestBorderVertex = False
+        self.furthestDistanceToBorder = False
+        self.water = False
+        self.renderForDiagnostics = False
+        self._points = None
+        self._neighbours = None
+
+    @property
+    def centre(self):
+        return self.grid.getVertexView(self.grid.centreVertexIndex(self.hexId))
+
+    @property
+    def points(self):
+        if self._points is None:
+            self._points = [self.grid.getVertexView(v) for v in self.grid.hexVertices[self.hexId].tolist()]
+        return self._points
+
+    @property
+    def neighbours(self):
+        if self._neighbours is None:
+            self._neighbours = [self.grid.getHexView(h) if h >= 0 else None for h in self.grid.hexNeighbours[self.hexId].tolist()]
+        return self._neighbours
+
+#
+# Vertex API over a single vertex of a HexGrid. Coordinates and altitude
+# read and write through to the grid arrays.
+#
+class VertexView(graph.BaseVertex):
+    __slots__ = ('grid', '_surroundingHexes')
+
+    def __init__(self, grid, vertexIndex):
+        self.grid = grid
+        self.id = vertexIndex
+        self.directionToCoast = False
+        self.drainingNeighbour = False
+        self.drainedNeighbours = ()
+        self.minBorderDistance = False
+        self._surroundingHexes = None
+
+    @property
+    def x(self):
+        return float(self.grid.vertexCoords[self.id, 0])
+
+    @x.setter
+    def x(self, value):
+        self.grid.vertexCoords[self.id, 0] = value
+
+    @property
+    def y(self):
+        return float(self.grid.vertexCoords[self.id, 1])
+
+    @y.setter
+    def y(self, value):
+        self.grid.vertexCoords[self.id, 1] = value
+
+    # Unassigned altitudes are stored as NaN and presented as None
+    @property
+    def altitude(self):
+        altitude = self.grid.vertexAltitudes[self.id]
+        return None if np.isnan(altitude) else float(altitude)
+
+    @altitude.setter
+    def altitude(self, value):
+        self.grid.vertexAltitudes[self.id] = np.nan if value is None else value
+
+    def isCentre(self):
+        return self.id >= self.grid.numCorners
+
+    @property
+    def surroundingHexes(self):
+        if self._surroundingHexes is None:
+            if self.isCentre():
+                hexIds = [self.id - self.grid.numCorners]
+            else:
+                hexIds = [h for h in self.grid.vertexHexes[self.id].tolist() if h >= 0]
+            self._surroundingHexes = tuple(self.grid.getHexView(h) for h in hexIds)
+        return self._surroundingHexes
+
+    # Perimeter vertices neighbour each other along edges shared by two hexes
+    @property
+    def neighbouringVertices(self):
+        neighbours = []
+        if not self.isCentre():
+            for hexId in self.grid.vertexHexes[self.id].tolist():
+                if hexId < 0:
+                    continue
+                points = self.grid.hexVertices[hexId].tolist()
+                i = points.index(self.id)
+                for edge, other in ((i, points[(i+1)%6]), ((i-1)%6, points[i-1])):
+                    if self.grid.hexNeighbours[hexId, edge] >= 0:
+                        view = self.grid.getVertexView(other)
+                        if view not in neighbours:
+                            neighbours.append(view)
+        return tuple(neighbours)
@@ -0,0 +1,116 @@
+import lazyimport
+
+np = lazyimport.LazyModule("numpy")
+
+#
+# Sets of hexes stored as boolean arrays over global hex ids, so that many
+# overlapping regions (lands, drainage basins, political areas) can be
+# combined with whole-array operations. A HexIndexer fixes the global ids of
+# a world's hexes; sets over the same indexer can be combined freely, and
+# convert to and from the dicts keyed by hexIndex that regions use.
+#
+
+class HexIndexer():
+    # hexes in the order that defines their ids, e.g. World.getHexList()
+    def __init__(self, hexes):
+        self.hexes = list(hexes)
+        self.hexIds = dict((nextHex.hexIndex, hexId) for hexId, nextHex in enumerate(self.hexes))
+
+    def __len__(self):
+        return len(self.hexes)
+
+    def getHexId(self, hexIndex):
+        return self.hexIds[hexIndex]
+
+    def getHexIds(self, hexIndices):
+        return np.fromiter((self.hexIds[hexIndex] for hexIndex in hexIndices), dtype=np.intp)
+
+class HexSet():
+    # members is a boolean array with one entry per hex id, or None for an empty set
+    def __init__(self, indexer, members=None):
+        self.indexer = indexer
+        if members is None:
+            members = np.zeros(len(indexer), dtype=bool)
+        self.members = members
+
+    def __len__(self):
+        return self.area()
+
+    # Number of hexes in the set
+    def area(self):
+        return int(np.count_nonzero(self.members))
+
+    def isEmpty(self):
+        return not self.members.any()
+
+    # Accepts a hexagon or a hexIndex
+    def contains(self, hexOrIndex):
+        hexIndex = getattr(hexOrIndex, "hexIndex", hexOrIndex)
+        hexId = self.indexer.hexIds.get(hexIndex)
+        return hexId is not None and bool(self.members[hexId])
+
+    def __contains__(self, hexOrIndex):
+        return self.contains(hexOrIndex)
+
+    def union(self, other):
+        return HexSet(self.indexer, self.members | other.members)
+
+    def intersection(self, other):
+        return HexSet(self.indexer, self.members & other.members)
+
+    def difference(self, other):
+        return HexSet(self.indexer, self.members & ~other.members)
+
+    def symmetricDifference(self, other):
+        return HexSet(self.indexer, self.members ^ other.members)
+
+    def __or__(self, other):
+        return self.union(other)
+
+    def __and__(self, other):
+        return self.intersection(other)
+
+    def __sub__(self, other):
+        return self.difference(other)
+
+    def __xor__(self, other):
+        return self.symmetricDifference(other)
+
+    def __eq__(self, other):
+        return isinstance(other, HexSet) and self.indexer is other.indexer and np.array_equal(self.members, other.members)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def isSubsetOf(self, other):
+        return not (self.members & ~other.members).any()
+
+    def intersects(self, other):
+        return bool((self.members & other.members).any())
+
+    def copy(self):
+        return HexSet(self.indexer, self.members.copy())
+
+    def add(self, hexOrIndex):
+        self.members[self.indexer.getHexId(getattr(hexOrIndex, "hexIndex", hexOrIndex))] = True
+
+    def remove(self, hexOrIndex):
+        self.members[self.indexer.getHexId(getattr(hexOrIndex, "hexIndex", hexOrIndex))] = False
+
+    # Ids of the member hexes, in ascending order
+    def getHexIds(self):
+        return np.flatnonzero(self.members)
+
+    # Member hexes keyed by hexIndex, the view regions hold, in hex id order
+    def toDict(self):
+        hexes = self.indexer.hexes
+        return dict((hexes[hexId].hexIndex, hexes[hexId]) for hexId in self.getHexIds().tolist())
+
+# Set of the hexes in a dict keyed by hexIndex
+def fromDict(indexer, hexes):
+    return fromHexIds(indexer, indexer.getHexIds(hexes.keys()))
+
+def fromHexIds(indexer, hexIds):
+    members = np.zeros(len(indexer), dtype=bool)
+    members[np.asarray(hexIds, dtype=np.intp)] = True
+    return HexSet(indexer, members)
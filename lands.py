@@ -4,13 +4,13 @@ import time
 
 import graph
 import regions
-import drawUtils
 import terrain
 import drainage
 import namegen
 from itertools import chain
-import pyglet
-import kytten
+import lazyimport
+
+pyglet = lazyimport.LazyModule("pyglet")
 
 #
 # GeographicZones are entities that represent terrain formations. They
@@ -29,8 +29,11 @@ class GeographicZone():
         
     def computeBorders(self):
         self.region.findBorderHexes()
-        self.region.calculateAllClosestBorderVertex()
-        self.region.findOrderedBorderVertices()
+        if self.world.coastDistanceField:
+            self.region.calculateBorderDistancesFromField(self.world.coastDistanceField)
+        else:
+            self.region.calculateAllClosestBorderVertex()
+        self.region.findOrderedBorderVertices(mesh=self.world.getHalfEdgeMesh())
 
     def getGeographicZoneBorderHexTrianglePoints(self, points, colours):
         self.region.getRegionBorderHexTrianglePoints(points, colours)
@@ -42,6 +45,10 @@ class GeographicZone():
         for geoZone in geoZones:
             self.region.adoptBordersFromRegion(geoZone.region)
 
+    # Adopt the borders this zone shares with other zones, looked up in a regions.BorderLoopIndex
+    def receiveBordersFromIndex(self, borderLoopIndex):
+        self.region.orderedBorderVertices.extend(borderLoopIndex.getSharedLoops(self.region))
+
 #
 # Land is a particular geographic zone that represents above-sea terrain.
 #
@@ -58,6 +65,7 @@ class Land(GeographicZone):
         self.sinks = set()
         self.outflows = set()
         self.drainageBasins = set()
+        self.drainageForest = None
         self.rivers = set()
         # Drainage routes
         self.calculateDrainageRoutes()
@@ -78,7 +86,7 @@ class Land(GeographicZone):
         # Assign heights to land vertices
         #terrain.assignEqualAltitudes(self.region)
         #terrain.assignHexMapAltitudes(self.region)
-        terrain.assignRegionVertexAltitudesFromCoast(self.region, self.world.noise)
+        terrain.assignRegionVertexAltitudesFromCoast(self.region, self.world.noise, self.world.grid)
         #terrain.assignNoisyAltitudes(self.region, self.noise)
 
     def calculateDrainageRoutes(self):
@@ -91,9 +99,26 @@ class Land(GeographicZone):
             else:
                 # hexagon nextHex is a sink for an endorheic drainage basin
                 self.sinks.add(nextHex)
-        for nextTermination in (self.outflows | self.sinks):
-            drainage.findHexesDrainedAbove(nextTermination)
+        if self.world.fillDepressions:
+            self.breachDepressions(self.world.minLakeDepth, self.world.minLakeArea)
+        drainage.accumulateFlow(self.region.hexes.values())
+        self.drainageForest = drainage.DrainageForest(sorted(self.outflows | self.sinks, key=lambda terminationHex: terminationHex.hexIndex))
+
 
+    # Drain sinks out to the sea along the spill routes of a priority-flood, except those in depressions
+    #  deep or wide enough to be kept as lakes. Noise leaves many shallow sinks that would otherwise each
+    #  become a drainage basin.
+    def breachDepressions(self, minLakeDepth, minLakeArea):
+        fillLevels, floodParents = drainage.floodFromCoast(self.region.hexes)
+        lakeHexes = drainage.findLakeHexes(self.region.hexes, fillLevels, minLakeDepth, minLakeArea)
+        breachedHexes = set()
+        for sinkHex in sorted(self.sinks, key=lambda sinkHex: sinkHex.hexIndex):
+            if sinkHex.hexIndex in lakeHexes or not sinkHex.hexIndex in fillLevels:
+                continue
+            self.sinks.remove(sinkHex)
+            outflowHex = drainage.breachSink(sinkHex, fillLevels, floodParents, lakeHexes, breachedHexes)
+            if outflowHex:
+                self.outflows.add(outflowHex)
 
     def createDrainageBasins(self, volumeThreshold=0):
         # Examine all hexes which border water
@@ -102,7 +127,7 @@ class Land(GeographicZone):
             #print("borderHex quantity drained = %d" % (borderHex.quantityDrained))
             if terminationHex.quantityDrained >= volumeThreshold:
                 # Consider this a river
-                newBasin = drainage.DrainageBasin(terminationHex)
+                newBasin = drainage.DrainageBasin(terminationHex, self.drainageForest)
                 #print("adding a basin")
                 self.drainageBasins.add(newBasin)
 
@@ -110,7 +135,7 @@ class Land(GeographicZone):
         # A low-bar can be applied to river length acceptance
         riverCandidates = []
         for nextHex in self.outflows:
-            river = drainage.River(nextHex)
+            river = drainage.River(nextHex, self.drainageForest)
             if len(river.routeHexes) > minRiverSize:
                 riverCandidates.append(river)
         # Percentage acceptance takes given percentage of longest rivers, and any others that share a length with those accepted
@@ -146,18 +171,18 @@ class Land(GeographicZone):
         return self.region.doesRegionContainHex(hex)
 
     # Batch render
-    def buildBatch(self, batch):
+    def buildBatch(self, batch, drawOptions):
         # Hexagon edges, fills, centres
-        if kytten.GetObjectfromName("cb_drawHexFills").get_value():
+        if drawOptions.get("drawHexFills"):
             self.buildHexFillList(batch)
-        if kytten.GetObjectfromName("cb_drawHexEdges").get_value():
+        if drawOptions.get("drawHexEdges"):
             self.buildHexEdgeList(batch)
-        if kytten.GetObjectfromName("cb_drawHexCentres").get_value():
+        if drawOptions.get("drawHexCentres"):
             self.buildHexCentreList(batch)
         # Region border
-        self.region.buildBatch(batch)
+        self.region.buildBatch(batch, drawOptions)
         # Rivers
-        if kytten.GetObjectfromName("cb_drawRivers").get_value():
+        if drawOptions.get("drawRivers"):
             for river in self.rivers:
                 river.buildBatch(batch)
 
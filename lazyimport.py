@@ -0,0 +1,30 @@
+import importlib
+import sys
+
+#
+# Deferred imports for heavy or optional modules. A LazyModule stands in
+# for a module at import time and only imports the real module when one
+# of its attributes is first used, e.g.
+#   pyglet = lazyimport.LazyModule("pyglet")
+#
+
+class LazyModule():
+    def __init__(self, moduleName):
+        self._moduleName = moduleName
+        self._module = sys.modules.get(moduleName)
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._moduleName)
+        return self._module
+
+    def isLoaded(self):
+        return self._module is not None
+
+    # Only called for attributes not found on the proxy itself
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __repr__(self):
+        state = "loaded" if self.isLoaded() else "not loaded"
+        return "<LazyModule %s (%s)>" % (self._moduleName, state)
@@ -1,3 +1,7 @@
+import time
+# Process start, from which the startup budget is measured
+startupTime = time.time()
+
 import pyglet
 from pyglet.gl import *
 from pyglet import image
@@ -7,6 +11,7 @@ from pyglet.window import mouse
 import kytten
 import string
 import sys
+import os
 
 import hexagon
 import random
@@ -14,14 +19,13 @@ import math
 import string
 import time
 
-# Import 2d Simplex Noise
-from noise import snoise2
-
 import graph
 import terrain
 import regions
 import lands
 import world
+import masks
+import noisecache
 import drawUtils
 
 batch = pyglet.graphics.Batch()
@@ -43,6 +47,10 @@ mouseY = 0
 
 hex_inspector_dialog = None
 
+# Startup budget, in seconds from process start to the first drawn frame
+interactiveWindowBudget = 1.5
+firstFrameDrawn = False
+
 selectedHex = None
 selectedVertex = None
 
@@ -53,6 +61,12 @@ Theme = kytten.Theme('KyttenTheme', override={
     "font_size": 10
 })
 
+def reportStartupTime(milestone, budget):
+    elapsed = time.time() - startupTime
+    print("%s after %.2fs from process start (budget %.2fs)" % (milestone, elapsed, budget))
+    if elapsed > budget:
+        print("WARNING: %s exceeded its startup budget." % (milestone))
+
 class GameWindow(pyglet.window.Window):
     def __init__(self, *args, **kwargs):
         pyglet.window.Window.__init__(self, *args, **kwargs)
@@ -175,7 +189,11 @@ class GameWindow(pyglet.window.Window):
 
     def on_draw(self):
         global newWorld
+        global firstFrameDrawn
         self.clear()
+        if not firstFrameDrawn:
+            firstFrameDrawn = True
+            reportStartupTime("Interactive window", interactiveWindowBudget)
         # Display FPS on screen
         if kytten.GetObjectfromName("cb_displayFPS").get_value():
             fps_display.draw()
@@ -201,6 +219,8 @@ if __name__ == '__main__':
 
     hexesInOddRow = 30
     newWorld = None
+    # Noise fields are kept on disk between launches, so regenerating at the same size skips noise
+    noiseCache = noisecache.NoiseCache()
     def generate_new_world(btn):
         global newWorld
         global maskImage
@@ -209,12 +229,24 @@ if __name__ == '__main__':
         window.update_hex_inspector()
         print("Generating a new world...")
         hexesInOddRow = int(kytten.GetObjectfromName("txt_mapSize").get_value())
-        t0 = time.clock()
+        t0 = time.time()
         random.seed(kytten.GetObjectfromName("txt_randSeed").get_value())
-        maskImage = pyglet.resource.image(kytten.GetObjectfromName("txt_maskFileName").get_value())
-        newWorld = world.World(screenWidth, screenHeight, hexesInOddRow, True, maskImage, createWeather)
-        t1 = time.clock()
+        maskFileName = kytten.GetObjectfromName("txt_maskFileName").get_value()
+        # Image is only used to display the mask, the world samples a mapped or decoded copy
+        maskImage = pyglet.resource.image(maskFileName)
+        landMask = masks.loadMask(os.path.join(pyglet.resource.get_script_home(), maskFileName))
+        newWorld = world.World(screenWidth, screenHeight, hexesInOddRow, True, landMask, createWeather, noiseCache=noiseCache)
+        t1 = time.time()
         print("Total world gen time: ", t1-t0)
+        # Attach rendering to the generated world
+        newWorld.buildBatch(getDrawOptions())
+
+    # Read GUI checkboxes that decide which world features are batched for rendering
+    def getDrawOptions():
+        drawOptions = dict()
+        for option in ["drawHexFills", "drawHexEdges", "drawHexCentres", "drawRivers", "drawIslandBorders"]:
+            drawOptions[option] = kytten.GetObjectfromName("cb_" + option).get_value()
+        return drawOptions
 
     def generate_new_seed(btn):
         seed = random.randint(0, sys.maxsize)
@@ -360,14 +392,6 @@ if __name__ == '__main__':
 
     # Create world
     maskImage = None
-    # Create local noise texture to blit
-    noiseTexture = image.Texture.create(screenWidth, screenHeight, GL_RGBA, True)
-    noiseTexData = noiseTexture.get_image_data()
-    noiseArray = terrain.createNoiseList(screenWidth, screenHeight, inBytes=False)
-    #noiseTexData.set_data('I', 800, noiseArray)
-    #noiseTexData.blit_to_texture(noiseTexture, 1, 0, 0, 0)
-    #noiseTexData.blit(0,0)
-
     pyglet.clock.schedule_interval(window.update, 1/120.0)
     pyglet.app.run()
     print("Ran app")
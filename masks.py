@@ -0,0 +1,198 @@
+import struct
+
+import lazyimport
+
+np = lazyimport.LazyModule("numpy")
+pyglet = lazyimport.LazyModule("pyglet")
+Image = lazyimport.LazyModule("PIL.Image")
+
+#
+# Land masks are greyscale images in which non-zero pixels mark land.
+# Mask data is handled as a 2D array of intensities with rows ordered from
+# the bottom of the image, as pyglet orders them. Hexes are classified
+# against a mask in batches, using arrays of hex centres and perimeter
+# points rather than one Hexagon at a time.
+#
+
+# BMP file header and the start of the BITMAPINFOHEADER that follows it
+BMP_HEADER_FORMAT = '<2sIHHIIiiHHI'
+BMP_HEADER_SIZE = struct.calcsize(BMP_HEADER_FORMAT)
+# Uncompressed RGB, and bitfields whose channel masks sit at the end of the info header
+BMP_RGB = 0
+BMP_BITFIELDS = 3
+BMP_MAPPABLE_BIT_COUNTS = (24, 32)
+# Red, green and blue masks, which follow the 14 byte file header and 40 byte BITMAPINFOHEADER,
+#  or fill the same place in later versions of the info header
+BMP_MASKS_FORMAT = '<III'
+BMP_MASKS_OFFSET = 54
+# Byte of each pixel holding the red channel, for the red masks that cover a whole byte
+BMP_RED_MASK_OFFSETS = {0x000000FF: 0, 0x0000FF00: 1, 0x00FF0000: 2, 0xFF000000: 3}
+
+# Header fields of a BMP file that can be memory-mapped directly, or None for any other file.
+#  redOffset is the byte of each pixel that holds the red channel.
+def readMappableBitmapHeader(fileName):
+    with open(fileName, 'rb') as bitmapFile:
+        header = bitmapFile.read(BMP_MASKS_OFFSET + struct.calcsize(BMP_MASKS_FORMAT))
+    if len(header) < BMP_HEADER_SIZE:
+        return None
+    signature, _, _, _, pixelOffset, _, width, height, _, bitCount, compression = struct.unpack_from(BMP_HEADER_FORMAT, header)
+    if signature != b'BM' or bitCount not in BMP_MAPPABLE_BIT_COUNTS:
+        return None
+    # Pixels are stored as BGR(A) unless bitfields say otherwise
+    redOffset = 2
+    if compression == BMP_BITFIELDS:
+        if bitCount != 32 or len(header) < BMP_MASKS_OFFSET + struct.calcsize(BMP_MASKS_FORMAT):
+            return None
+        redMask, _, _ = struct.unpack_from(BMP_MASKS_FORMAT, header, BMP_MASKS_OFFSET)
+        # Only a red channel filling a whole byte can be read as a strided view, other layouts are decoded
+        if not redMask in BMP_RED_MASK_OFFSETS:
+            return None
+        redOffset = BMP_RED_MASK_OFFSETS[redMask]
+    elif compression != BMP_RGB:
+        return None
+    return {"pixelOffset": pixelOffset, "width": width, "height": height, "bitCount": bitCount, "redOffset": redOffset}
+
+# Mask backed by a memory-mapped BMP file. Rows are a strided view of the red channel
+#  in the mapped pixel data, so nothing is read from disk until pixels are sampled.
+class BitmapMask():
+    def __init__(self, fileName, header=None):
+        if not header:
+            header = readMappableBitmapHeader(fileName)
+        self.fileName = fileName
+        self.width = header["width"]
+        self.height = abs(header["height"])
+        bytesPerPixel = header["bitCount"] // 8
+        # Pixel rows are padded to a multiple of four bytes
+        stride = (self.width*bytesPerPixel + 3) & ~3
+        self.pixels = np.memmap(fileName, dtype=np.uint8, mode='r', offset=header["pixelOffset"], shape=(self.height, stride))
+        redOffset = header["redOffset"]
+        self.rows = self.pixels[:, redOffset:self.width*bytesPerPixel:bytesPerPixel]
+        # A negative height marks a top-down bitmap
+        if header["height"] < 0:
+            self.rows = self.rows[::-1]
+
+# Mask decoded into memory, for compressed formats such as JPG and PNG and for bitmaps that can't be mapped.
+#  Pillow decodes without touching OpenGL, so masks load on hosts with no display. Without it, pyglet's
+#  decoders are used, which need a display.
+class DecodedMask():
+    def __init__(self, fileName):
+        self.fileName = fileName
+        try:
+            self.rows = decodeImage(fileName)
+        except ImportError:
+            self.rows = getMaskData(pyglet.image.load(fileName))
+        self.height, self.width = self.rows.shape
+
+# 2D array of the red channel (or the grey level) of an image file, rows ordered from the bottom
+def decodeImage(fileName):
+    with Image.open(fileName) as image:
+        pixels = np.asarray(image.convert('RGB'))
+    return np.ascontiguousarray(pixels[::-1, :, 0])
+
+# Mask for an image file, memory-mapped when it is an uncompressed bitmap and decoded otherwise
+def loadMask(fileName):
+    header = readMappableBitmapHeader(fileName)
+    if header:
+        return BitmapMask(fileName, header)
+    return DecodedMask(fileName)
+
+# 2D array of mask intensities, one byte per pixel, rows ordered from the bottom of the image.
+#  maskImage may be a mask from loadMask, a 2D array or a pyglet image.
+def getMaskData(maskImage):
+    if hasattr(maskImage, "rows"):
+        return maskImage.rows
+    if isinstance(maskImage, np.ndarray):
+        return maskImage
+    maskImageData = maskImage.get_image_data()
+    data = maskImageData.get_data('I', maskImage.width)
+    return np.frombuffer(data, dtype=np.uint8).reshape(maskImage.height, maskImage.width)
+
+# Vote on each hex using its perimeter points, pulled towards the hex centre by attenuation.
+#  centres is an (n, 2) array and points an (n, 6, 2) array of coordinates.
+#  Returns arrays of the indices of land hexes and of water hexes.
+def classifyHexesByVotes(maskRows, centres, points, passRate=0.5, attenuation=0.8):
+    imageWidth = maskRows.shape[1]
+    centres = centres[:, None, :]
+    # Attenuated positions are closer to the centre of the hex, truncated to pixels as in Hexagon.compareToMaskImage
+    attenuated = np.trunc(centres + (points - centres)*attenuation).astype(np.int64)
+    # Same pixel as the flat index used by Hexagon.compareToMaskImage, including its wrap at column zero
+    pixelRows, pixelCols = np.divmod(attenuated[:,:,0] + (attenuated[:,:,1]-1)*imageWidth - 1, imageWidth)
+    votes = np.count_nonzero(maskRows[pixelRows, pixelCols] > 0, axis=1)
+    isLand = votes >= passRate*points.shape[1]
+    return np.flatnonzero(isLand), np.flatnonzero(~isLand)
+
+# Summed-area table of land pixels, with a leading row and column of zeros so that
+#  the land pixel count of rows [r0, r1) and columns [c0, c1) is
+#  table[r1,c1] - table[r0,c1] - table[r1,c0] + table[r0,c0]
+def createSummedAreaTable(maskRows):
+    isLand = np.asarray(maskRows) > 0
+    table = np.zeros((isLand.shape[0]+1, isLand.shape[1]+1), dtype=np.int64)
+    np.cumsum(np.cumsum(isLand, axis=0), axis=1, out=table[1:,1:])
+    return table
+
+# Fraction of the pixels whose centres fall inside each hex that are land.
+#  Pixel (col, row) covers [col, col+1) x [row, row+1) in world coordinates.
+#  Hexes whose bounding box is all land or all water are decided in O(1) from the summed-area
+#  table, the rest are measured exactly from the hex polygon one pixel column at a time.
+def findHexCoverage(maskRows, centres, points, summedAreaTable=None):
+    if summedAreaTable is None:
+        summedAreaTable = createSummedAreaTable(maskRows)
+    imageHeight, imageWidth = summedAreaTable.shape[0]-1, summedAreaTable.shape[1]-1
+    # Bounding boxes, as ranges of pixels whose centres could lie inside each hex
+    colStarts = np.clip(np.ceil(points[:,:,0].min(axis=1) - 0.5), 0, imageWidth).astype(np.int64)
+    colEnds = np.clip(np.ceil(points[:,:,0].max(axis=1) - 0.5), 0, imageWidth).astype(np.int64)
+    rowStarts = np.clip(np.ceil(points[:,:,1].min(axis=1) - 0.5), 0, imageHeight).astype(np.int64)
+    rowEnds = np.clip(np.ceil(points[:,:,1].max(axis=1) - 0.5), 0, imageHeight).astype(np.int64)
+    boxLand = (summedAreaTable[rowEnds, colEnds] - summedAreaTable[rowStarts, colEnds]
+        - summedAreaTable[rowEnds, colStarts] + summedAreaTable[rowStarts, colStarts])
+    boxArea = (rowEnds - rowStarts) * (colEnds - colStarts)
+    coverage = np.where(boxLand > 0, 1.0, 0.0)
+    mixed = np.flatnonzero(((boxLand > 0) & (boxLand < boxArea)) | (boxArea == 0))
+    if len(mixed):
+        landCounts, pixelCounts = countPixelsInPolygons(summedAreaTable, points[mixed])
+        # Hexes too small to contain a pixel centre use the pixel under their centre
+        centrePixels = sampleMaskAt(maskRows, centres[mixed])
+        coverage[mixed] = np.where(pixelCounts > 0, landCounts / np.maximum(pixelCounts, 1), centrePixels > 0)
+    return coverage
+
+# Land and total pixel counts for the pixel centres inside each clockwise polygon in points (n, k, 2).
+#  Each edge contributes the pixels below it in every column its x range spans: edges along the
+#  top of a clockwise polygon run rightwards and add, edges along the bottom run leftwards and subtract.
+def countPixelsInPolygons(summedAreaTable, points):
+    imageHeight, imageWidth = summedAreaTable.shape[0]-1, summedAreaTable.shape[1]-1
+    # Land pixel counts per column, from the bottom of the image up to each row
+    columnCounts = summedAreaTable[:,1:] - summedAreaTable[:,:-1]
+    edgeStarts = points.reshape(-1, 2)
+    edgeEnds = np.roll(points, -1, axis=1).reshape(-1, 2)
+    polygonIds = np.repeat(np.arange(len(points)), points.shape[1])
+    signs = np.sign(edgeEnds[:,0] - edgeStarts[:,0]).astype(np.int64)
+    # Columns whose pixel centres lie in [left, right) of each edge
+    left = np.minimum(edgeStarts[:,0], edgeEnds[:,0])
+    right = np.maximum(edgeStarts[:,0], edgeEnds[:,0])
+    firstCols = np.clip(np.ceil(left - 0.5), 0, imageWidth).astype(np.int64)
+    lastCols = np.clip(np.ceil(right - 0.5), 0, imageWidth).astype(np.int64)
+    spans = np.maximum(lastCols - firstCols, 0) * (signs != 0)
+    edgeIds = np.repeat(np.arange(len(spans)), spans)
+    # Column of each (edge, column) pair, counting up from the edge's first column
+    cols = firstCols[edgeIds] + np.arange(len(edgeIds)) - np.repeat(np.cumsum(spans) - spans, spans)
+    x0, y0 = edgeStarts[edgeIds,0], edgeStarts[edgeIds,1]
+    x1, y1 = edgeEnds[edgeIds,0], edgeEnds[edgeIds,1]
+    edgeY = y0 + (cols + 0.5 - x0) * (y1 - y0) / (x1 - x0)
+    # Rows whose pixel centres lie below the edge
+    rowsBelow = np.clip(np.ceil(edgeY - 0.5), 0, imageHeight).astype(np.int64)
+    edgeSigns = signs[edgeIds]
+    landCounts = np.bincount(polygonIds[edgeIds], weights=edgeSigns*columnCounts[rowsBelow, cols], minlength=len(points))
+    pixelCounts = np.bincount(polygonIds[edgeIds], weights=edgeSigns*rowsBelow, minlength=len(points))
+    return landCounts, pixelCounts
+
+# Mask intensity at each point of an (n, 2) array of coordinates, clipped to the image
+def sampleMaskAt(maskRows, coords):
+    cols = np.clip(coords[:,0].astype(np.int64), 0, maskRows.shape[1]-1)
+    rows = np.clip(coords[:,1].astype(np.int64), 0, maskRows.shape[0]-1)
+    return np.asarray(maskRows[rows, cols])
+
+# Classify hexes by the fraction of their area that is land.
+#  Returns arrays of the indices of land hexes and of water hexes.
+def classifyHexesByCoverage(maskRows, centres, points, landThreshold=0.5):
+    isLand = findHexCoverage(maskRows, centres, points) >= landThreshold
+    return np.flatnonzero(isLand), np.flatnonzero(~isLand)
@@ -0,0 +1,79 @@
+import os
+import tempfile
+
+import terrain
+import lazyimport
+
+np = lazyimport.LazyModule("numpy")
+
+#
+# On-disk cache of full noise fields. Each field is stored as a .npy file
+# named after the parameters it was generated with and loaded back
+# memory-mapped. Files are evicted least recently used first once the cache
+# grows past its size limit.
+#
+
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".noisecache")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Bumped whenever the noise algorithm changes, so stale fields are never loaded
+NOISE_VERSION = 1
+
+# processes is the size of the pool used to generate fields that are not cached yet
+class NoiseCache():
+    def __init__(self, directory=DEFAULT_DIRECTORY, maxBytes=DEFAULT_MAX_BYTES, processes=1):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.processes = processes
+
+    def getFileName(self, width, height, octaves):
+        freq = 8.0 * octaves
+        return os.path.join(self.directory, "noise_v%d_%dx%d_o%d_f%g.npy" % (NOISE_VERSION, width, height, octaves, freq))
+
+    # Read-only (height, width) noise field, generated and stored on first use.
+    #  Fields are stored in single precision, which holds simplex noise values exactly.
+    def getNoiseArray(self, width, height, octaves=4):
+        fileName = self.getFileName(width, height, octaves)
+        if os.path.exists(fileName):
+            # Loading counts as a use for eviction
+            os.utime(fileName)
+            return np.load(fileName, mmap_mode='r')
+        print("Generating noise for cache: %s" % (os.path.basename(fileName)))
+        noiseArray = terrain.createNoiseArray(width, height, octaves, self.processes)
+        self.storeNoiseArray(fileName, noiseArray)
+        self.evictLeastRecentlyUsed(keep=fileName)
+        return np.load(fileName, mmap_mode='r')
+
+    # Write to a temporary file first so other processes never load a partial field
+    def storeNoiseArray(self, fileName, noiseArray):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        fileHandle, tempFileName = tempfile.mkstemp(suffix=".npy", dir=self.directory)
+        with os.fdopen(fileHandle, 'wb') as tempFile:
+            np.save(tempFile, noiseArray)
+        os.replace(tempFileName, fileName)
+
+    # Cached fields as (last used time, size, file name), least recently used first
+    def getCachedFiles(self):
+        cachedFiles = []
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.startswith("noise_") and name.endswith(".npy"):
+                    fileStat = os.stat(os.path.join(self.directory, name))
+                    cachedFiles.append((fileStat.st_mtime, fileStat.st_size, os.path.join(self.directory, name)))
+        return sorted(cachedFiles)
+
+    def evictLeastRecentlyUsed(self, keep=None):
+        cachedFiles = self.getCachedFiles()
+        totalBytes = sum(size for _, size, _ in cachedFiles)
+        for _, size, fileName in cachedFiles:
+            if totalBytes <= self.maxBytes:
+                break
+            if fileName == keep:
+                continue
+            print("Evicting cached noise: %s" % (os.path.basename(fileName)))
+            os.remove(fileName)
+            totalBytes -= size
+
+    def clear(self):
+        for _, _, fileName in self.getCachedFiles():
+            os.remove(fileName)
@@ -1,15 +1,19 @@
-import pyglet
-from pyglet.gl import *
-from pyglet import image
+import math
 import random
 import copy
 import time
-from itertools import chain
-import scipy.spatial as spatial
+import heapq
+from itertools import chain, count
 
 import graph
-import drawUtils
-import kytten
+import halfedge
+import hexset
+import lazyimport
+
+pyglet = lazyimport.LazyModule("pyglet")
+drawUtils = lazyimport.LazyModule("drawUtils")
+spatial = lazyimport.LazyModule("scipy.spatial")
+np = lazyimport.LazyModule("numpy")
 
 #
 # Regions are areas of hexes that are bounded by a border. Regions
@@ -26,33 +30,57 @@ class Region():
         self.borderVertices = dict()
         self.orderedBorderVertices = []
         self.closestBorderVertex = dict()
+        # Each vertex's distance to the region's border and vector to its closest border point, by vertex id
+        self.vertexBorderDistances = dict()
+        self.vertexCoastDirections = dict()
         self.largestVertexBorderDistance = False
+        # Distance field the border distances were read from, or None when they were measured to border vertices
+        self.distanceField = None
+        # Indexes of the points with distances and of the border vertices, the points closest to each border
+        #  vertex by its id, and a max-heap of (-distance, point id) entries that go stale as distances change.
+        #  Built when distances are first repaired and kept up to date from then on.
+        self.pointBuckets = None
+        self.borderVertexIndex = None
+        self.servedPoints = dict()
+        self.borderDistanceHeap = None
+        # Mesh the border loops were traced over, and the traced loop through each border vertex, by vertex id
+        self.borderMesh = None
+        self.vertexBorderLoops = dict()
+        # Membership as a hexset.HexSet, built on first use for set algebra with other regions
+        self.hexSet = None
         # Vertex list for rendering
         self.border_vert_lists = []
 
+    # Label hexes with their ring distance from the region's edge, in one breadth-first pass that starts
+    #  from every hex with a neighbour outside the region. ringDepth, if given, is the last ring labelled.
     def findBorderHexes(self, ringDepth=False):
         #print("Finding all border hexes...")
-        unassignedHexes = copy.copy(self.hexes)
-        borderHexes = []
+        self.hexBorderDistances = dict()
+        frontier = []
+        for nextHex in self.hexes.values():
+            for neighbour in nextHex.getNeighbours():
+                # If hex neighbour is not in region it must be a border hex
+                if not neighbour.hexIndex in self.hexes:
+                    self.hexBorderDistances[nextHex.hexIndex] = 0
+                    frontier.append(nextHex)
+                    break
         ringNumber = 0
-        while unassignedHexes.values():
-            if ringNumber <= ringDepth or not ringDepth:
-                nextRing = dict()
-                # Find members of the group which have neigbours that aren't in the group
-                for nextHex in unassignedHexes.values():
-                    for neighbour in nextHex.neighbours.values():
-                        # If hex neighbour is not in region it must be a border hex
-                        if not neighbour.hexIndex in unassignedHexes:
-                            nextRing[nextHex.hexIndex] = nextHex
-                # Remove hexes that have now been assigned
-                for borderHex in nextRing.values():
-                    #print("Hex %s is in ring %d" % (str(borderHex.hexIndex), ringNumber))
-                    del unassignedHexes[borderHex.hexIndex]
-                    # Store the hex's distance to the edge of the region
-                    self.hexBorderDistances[borderHex.hexIndex] = ringNumber
-                ringNumber += 1
-                # Append set of border hexes to 
-                self.borderHexes.append(nextRing)
+        while frontier and (not ringDepth or ringNumber < ringDepth):
+            ringNumber += 1
+            nextFrontier = []
+            for nextHex in frontier:
+                for neighbour in nextHex.getNeighbours():
+                    if neighbour.hexIndex in self.hexes and not neighbour.hexIndex in self.hexBorderDistances:
+                        # Store the hex's distance to the edge of the region
+                        self.hexBorderDistances[neighbour.hexIndex] = ringNumber
+                        nextFrontier.append(neighbour)
+            frontier = nextFrontier
+        # Group hexes into rings, keeping the order they have in the region
+        totalRings = max(self.hexBorderDistances.values()) + 1 if self.hexBorderDistances else 0
+        self.borderHexes = [dict() for i in range(totalRings)]
+        for hexIndex, nextHex in self.hexes.items():
+            if hexIndex in self.hexBorderDistances:
+                self.borderHexes[self.hexBorderDistances[hexIndex]][hexIndex] = nextHex
 
     def findBorderVertices(self, drawBorderVertices=False):
         #print("Finding all border vertices...")
@@ -68,7 +96,7 @@ class Region():
                 if not point in self.borderVertices:
                     # Check point's neighbours to determine if it is on border
                     hasExternalNeighbour = False
-                    for neighbourHex in point.surroundingHexes.values():
+                    for neighbourHex in point.surroundingHexes:
                         # Check dictionary of region hexes to see if this neighbour is a member
                         if not neighbourHex.hexIndex in self.hexes:
                             # This point is a border vertex
@@ -85,52 +113,31 @@ class Region():
                         #print("point had no neighbours outside of region")
                         pass
 
-    def findOrderedBorderVertices(self, drawBorderVertices=True, borderVertexColor=(0.1, 0.5, 0.5, 1)):
+    # Order border vertices into loops by walking the border over a half-edge mesh. mesh is a
+    #  halfedge.HexMesh containing the region's hexes, made from the region alone if not given.
+    def findOrderedBorderVertices(self, drawBorderVertices=False, borderVertexColor=(0.1, 0.5, 0.5, 1), mesh=None):
         #print("Finding all border vertices and storing them as an ordered sequence...")
         if not self.borderVertices:
             # Find the outer ring of region hexes if not already known
             self.findBorderVertices()
+        if not mesh:
+            mesh = halfedge.createHexMesh(self.hexes.values())
+        self.borderMesh = mesh
+        isInRegion = mesh.createHexMembershipTest(self.hexes)
 
-        # Handle non-contiguous borders by 
-        remainingBorderVertices = copy.copy(self.borderVertices)        
+        # Handle non-contiguous borders by starting a new loop from any border vertex not yet visited
+        remainingBorderVertices = copy.copy(self.borderVertices)
         while remainingBorderVertices:
             #print("Taking another starting point... total left: %d" % (len(remainingBorderVertices)))
             # Take first point from those still undrawn
-            startingPoint = list(remainingBorderVertices.values())[0]
-            currentHex = False
-            for neighbour in startingPoint.surroundingHexes.values():
-                if neighbour.hexIndex in self.hexes:
-                    currentHex = neighbour
-                    break
-
-            if not currentHex:
-                print("WARNING: Starting point for border drawing was not found.")
-            currentPoint = startingPoint
-
-            borderList = []
-            # Continue while list is empty or start has not been reached in looping exploration
-            while not startingPoint == currentPoint or not borderList:
-                # Add point to list
-                borderList.append(currentPoint)
+            startingPoint = next(iter(remainingBorderVertices.values()))
+            borderList = self.traceBorderLoop(startingPoint, mesh, isInRegion)
+            if not borderList:
+                del remainingBorderVertices[ startingPoint.id ]
+                continue
+            for point in borderList:
                 # Remove point from the list of remaining border vertices
-                if currentPoint.id in remainingBorderVertices:
-                    #print("Removing point from remainingBorderVertices. Is %d in borderList %d." % (len(borderList)-1, len(self.orderedBorderVertices)))
-                    del remainingBorderVertices[ currentPoint.id ]
-                # Attempt to determine if currentPoint straddles a second hex which should now be explored
-                i, indexFound = currentHex.getPointIndex(currentPoint)
-                if not indexFound:
-                    print("WARNING: Index for current point was not found in currentHex.")
-                # Look in ith direction, to obey winding order          
-                #  Check if neighbour exists before accessing, as border hexes may be missing neighbours
-                if i in currentHex.neighbours and currentHex.neighbours[i].hexIndex in self.hexes:
-                    #print("Hex %s is being replaced by hex %s as current hex" % (str(currentHex.hexIndex), str(currentHex.neighbours[i].hexIndex)))
-                    currentHex = currentHex.neighbours[i]
-                    currentPoint = currentHex.getSuccessivePoint(currentPoint)
-                else:
-                    nextI = (i+1) % len(currentHex.points)
-                    #print("Hex %s is staying current hex. Incrementing i to %d" % (str(currentHex.hexIndex), nextI))
-                    currentPoint = currentHex.points[ nextI ]
-            self.orderedBorderVertices.append(borderList)
+                remainingBorderVertices.pop(point.id, None)
         # Now all points have been found, draw them if required
         if drawBorderVertices:
             for borderList in self.orderedBorderVertices:
@@ -140,13 +147,26 @@ class Region():
                         ('v2f', point.getCoords())
                     )
 
+    # Trace the border loop through a border vertex and store it with the region's ordered borders
+    def traceBorderLoop(self, startingPoint, mesh, isInRegion):
+        startingVertex = mesh.getVertexIndex(startingPoint)
+        startingEdge = mesh.findBorderEdgeFrom(startingVertex, isInRegion) if startingVertex != -1 else -1
+        if startingEdge == -1:
+            print("WARNING: Starting point for border drawing was not found.")
+            return None
+        borderList = [mesh.getVertexPoint(mesh.originList[edge]) for edge in mesh.traceBoundary(startingEdge, isInRegion)]
+        for point in borderList:
+            self.vertexBorderLoops[point.id] = borderList
+        self.orderedBorderVertices.append(borderList)
+        return borderList
+
     def adoptBordersFromRegion(self, givenRegion):
         # For each border of the given region, determine if it borders this region
         if givenRegion.orderedBorderVertices:
             for nextBorder in givenRegion.orderedBorderVertices:
                 # Examine neighbours for first border vertex in border list
                 for neighbour in nextBorder[0].surroundingHexes:
-                    if neighbour in self.hexes:
+                    if neighbour.hexIndex in self.hexes:
                         # This vertex at nextBorder[0] borders both regions, so adopt entire border list
                         self.orderedBorderVertices.append(nextBorder)
                         # Break from iterating over neighbours
@@ -172,55 +192,98 @@ class Region():
         if not self.borderVertices:
             self.findBorderVertices()
 
+        t0 = time.time()
+        self.distanceField = None
+        self.borderDistanceHeap = None
+        points = self.getRegionPoints()
         #useKdTree = len(self.borderVertices) > 300
-        tree = None
         if useKdTree:
-            # Create kdtree of border vertices
-            points = []
-            for nextV in self.borderVertices.items():
-                points.append((nextV[1].x,nextV[1].y))
-            tree = spatial.cKDTree(points)
-
-        t0 = time.clock()
-        pointCount = 0
-        # Search border vertices for closest point
+            # Create kdtree of border vertices and query it for all points at once
+            borderVertexList = list(self.borderVertices.values())
+            tree = spatial.cKDTree([(borderVertex.x, borderVertex.y) for borderVertex in borderVertexList])
+            distances, closestVertexIds = tree.query([(point.x, point.y) for point in points], k=1, workers=-1)
+            closestBorderVertices = [borderVertexList[i] for i in closestVertexIds.tolist()]
+        else:
+            closestBorderVertices, distances = [], []
+            for nextPoint in points:
+                closestBorderVertex, distance = self.findClosestBorderVertex(nextPoint)
+                closestBorderVertices.append(closestBorderVertex)
+                distances.append(distance)
+            distances = np.array(distances, dtype=np.float64)
+        # Register points' closest border vertices with region
+        for nextPoint, closestBorderVertex in zip(points, closestBorderVertices):
+            self.closestBorderVertex[ nextPoint.id ] = closestBorderVertex
+            self.vertexBorderDistances[ nextPoint.id ] = nextPoint.distanceFrom(closestBorderVertex)
+            self.vertexCoastDirections[ nextPoint.id ] = ( (closestBorderVertex.x-nextPoint.x), (closestBorderVertex.y-nextPoint.y) )
+            # Draw diagnostic arrows from region points to nearest coastal points if required
+            if drawArrowsToCoast:
+                drawUtils.drawArrow([nextPoint.x, nextPoint.y], [closestBorderVertex.x, closestBorderVertex.y], (0,1,0,1))
+        # Keep track of region's longest distance, for possible normalisation purposes
+        if len(points) and distances.max() > self.largestVertexBorderDistance:
+            self.largestVertexBorderDistance = distances.max().item()
+        self.assignHexBorderDistances(points, distances)
+        t1 = time.time()
+        print("Time spent finding closest border verts: %f" % (t1-t0))
+        print("Total border vertices: %d, total vertices: %d, total hexes: %d" % (len(self.borderVertices), len(points), len(self.hexes.values())))
+
+    # Alternative to calculateAllClosestBorderVertex, reading distances to the coast and coast directions
+    #  off a distancefield.CoastDistanceField covering the whole world
+    def calculateBorderDistancesFromField(self, distanceField, drawArrowsToCoast=False):
+        t0 = time.time()
+        self.distanceField = distanceField
+        self.borderDistanceHeap = None
+        points = self.getRegionPoints()
+        distances = self.sampleBorderDistances(points, drawArrowsToCoast)
+        self.assignHexBorderDistances(points, distances)
+        print("Time spent sampling coast distances: %f" % (time.time()-t0))
+
+    # Read distances to the coast and coast directions for points off the region's distance field
+    def sampleBorderDistances(self, points, drawArrowsToCoast=False):
+        # Regions are either all land or all water
+        onLand = bool(self.hexes) and bool(next(iter(self.hexes.values())).land)
+        distances, coastVectors = self.distanceField.sample([point.x for point in points], [point.y for point in points], onLand)
+        for nextPoint, distance, coastVector in zip(points, distances.tolist(), coastVectors.tolist()):
+            self.vertexBorderDistances[ nextPoint.id ] = distance
+            self.vertexCoastDirections[ nextPoint.id ] = tuple(coastVector)
+            if drawArrowsToCoast:
+                drawUtils.drawArrow([nextPoint.x, nextPoint.y], [nextPoint.x+coastVector[0], nextPoint.y+coastVector[1]], (0,1,0,1))
+        if len(points) and distances.max() > self.largestVertexBorderDistance:
+            self.largestVertexBorderDistance = distances.max().item()
+        return distances
+
+    # The points of the region's hexes, each once however many of the hexes share it
+    def getRegionPoints(self):
+        uniquePoints = dict()
         for nextHex in self.hexes.values():
-            largestDistToBorder = 0
             for nextPoint in nextHex.points:
-                pointCount += 1
-                # Store point's distance to border in dict with point coordinates as key
-                closestBorderVertex = None
-                distance = None
-                if useKdTree:
-                    distance, closestVertexId = tree.query([nextPoint.x, nextPoint.y], k=1)
-                    closestBorderVertex = self.borderVertices.items()[closestVertexId][1]
-                else:
-                    closestBorderVertex, distance = self.findClosestBorderVertex(nextPoint)
-                # Track hex's shortest distance to border
-                if not nextHex.nearestBorderVertex or distance < nextHex.shortestDistanceToBorder:
-                    nextHex.shortestDistanceToBorder = distance
-                    nextHex.nearestBorderVertex = nextPoint
-                # Track hex's largest 'shortest distance to border'
-                largestDistToBorder = max(distance, largestDistToBorder)
-                # Draw diagnostic arrows from region points to nearest coastal points if required
-                if drawArrowsToCoast:
-                    drawUtils.drawArrow([nextPoint.x, nextPoint.y], [closestBorderVertex.x, closestBorderVertex.y], (0,1,0,1))
-                # Keep track of region's longest distance, for possible normalisation purposes
-                if distance > self.largestVertexBorderDistance:
-                    self.largestVertexBorderDistance = distance
-                # Register point's distance to border with region
-                self.closestBorderVertex[ nextPoint.id ] = closestBorderVertex
-            nextHex.furthestDistanceToBorder = largestDistToBorder
-        t1 = time.clock()
-        print("Time spent finding closest border verts: %f" % (t1-t0))
-        print("Total border vertices: %d, total vertices: %d, total hexes: %d" % (len(self.borderVertices), pointCount, len(self.hexes.values())))
+                uniquePoints.setdefault(nextPoint.id, nextPoint)
+        return list(uniquePoints.values())
+
+    # Set each hex's shortest and furthest vertex distance to the border, and its vertex nearest the border,
+    #  from an array of distances for the region's unique points. hexList limits this to some of the region's hexes.
+    def assignHexBorderDistances(self, points, distances, hexList=None):
+        # Index of each hex point in the given points, so per-hex distances are found in bulk
+        pointIndices = dict((point.id, i) for i, point in enumerate(points))
+        hexList = list(self.hexes.values()) if hexList is None else hexList
+        if not hexList:
+            return
+        hexPointIndices = np.array([[pointIndices[point.id] for point in nextHex.points] for nextHex in hexList], dtype=np.intp)
+        hexDistances = distances[hexPointIndices]
+        # Track hexes' shortest distance to border and their largest 'shortest distance to border'
+        nearestPointColumns = hexDistances.argmin(axis=1).tolist()
+        shortestDistances = hexDistances.min(axis=1).tolist()
+        furthestDistances = hexDistances.max(axis=1).tolist()
+        for nextHex, nearestColumn, shortestDistance, furthestDistance in zip(hexList, nearestPointColumns, shortestDistances, furthestDistances):
+            nextHex.shortestDistanceToBorder = shortestDistance
+            nextHex.nearestBorderVertex = nextHex.points[nearestColumn]
+            nextHex.furthestDistanceToBorder = max(furthestDistance, 0)
 
     def doesPointBorderRegion(self, v0):
         # Internal neighbour is a hex in this region, assumed not to exist
         internalNeighbour = False
         # External neighbour is a hex in a different region, assumed not to exist
         externalNeighbour = False
-        for neighbour in v0.surroundingHexes.values():
+        for neighbour in v0.surroundingHexes:
             if neighbour.hexIndex in self.hexes:
                 # This discovery proves at this point either is in or borders the region
                 internalNeighbour = True
@@ -230,6 +293,315 @@ class Region():
         # Point borders region iff both conditions are true
         return (internalNeighbour and externalNeighbour)
 
+    # Add hexes to the region, updating the border data already computed for it around the new hexes
+    #  instead of recomputing it. mesh is the halfedge.HexMesh to trace changed border loops over,
+    #  by default the one the loops were first traced over.
+    def addHexes(self, hexes, mesh=None):
+        addedHexes = []
+        for nextHex in hexes:
+            if not nextHex.hexIndex in self.hexes:
+                self.hexes[nextHex.hexIndex] = nextHex
+                addedHexes.append(nextHex)
+        self.updateAroundHexes(addedHexes, mesh)
+
+    # Remove hexes from the region, updating its border data around them as addHexes does
+    def removeHexes(self, hexes, mesh=None):
+        removedHexes = []
+        for nextHex in hexes:
+            if nextHex.hexIndex in self.hexes:
+                del self.hexes[nextHex.hexIndex]
+                removedHexes.append(nextHex)
+        self.updateAroundHexes(removedHexes, mesh)
+
+    # Repair border rings, border vertices, border loops and distances to the border after hexes have
+    #  joined or left the region. Work is limited to the rings, loops and nearest-border areas the changed
+    #  hexes touch. Regions that adopted this region's loops must adopt them again.
+    def updateAroundHexes(self, changedHexes, mesh=None):
+        if not changedHexes:
+            return
+        if self.hexSet is not None:
+            for nextHex in changedHexes:
+                self.hexSet.members[self.hexSet.indexer.getHexId(nextHex.hexIndex)] = nextHex.hexIndex in self.hexes
+        changedPoints = dict()
+        for nextHex in changedHexes:
+            for point in nextHex.points:
+                changedPoints.setdefault(point.id, point)
+        if self.hexBorderDistances:
+            self.repairBorderHexes(changedHexes)
+        removedBorderVertices, addedBorderVertices = self.updateBorderVertices(changedPoints.values())
+        if self.borderMesh:
+            self.updateOrderedBorderVertices(changedHexes, changedPoints.values(), mesh or self.borderMesh)
+        if self.vertexBorderDistances:
+            self.repairBorderDistances(changedPoints.values(), removedBorderVertices, addedBorderVertices)
+
+    def isBorderHex(self, nextHex):
+        for neighbour in nextHex.getNeighbours():
+            if not neighbour.hexIndex in self.hexes:
+                return True
+        return False
+
+    # Relabel the ring distances that changed hexes invalidate. Labels that lost their support are withdrawn,
+    #  spreading inwards one ring at a time, then the gaps are refilled by a breadth-first pass seeded from
+    #  the labels around them.
+    def repairBorderHexes(self, changedHexes):
+        distances = self.hexBorderDistances
+        # Labels before the repair of the hexes being relabelled
+        previousDistances = dict()
+        def withdrawDistance(hexIndex):
+            previousDistances.setdefault(hexIndex, distances.get(hexIndex))
+            return distances.pop(hexIndex, None)
+        candidateHexes = dict()
+        for changedHex in changedHexes:
+            if not changedHex.hexIndex in self.hexes:
+                withdrawDistance(changedHex.hexIndex)
+            for nextHex in [changedHex] + changedHex.getNeighbours():
+                if nextHex.hexIndex in self.hexes:
+                    candidateHexes[nextHex.hexIndex] = nextHex
+        # Ring 0 hexes must still be on the edge, and others need a neighbour one ring further out
+        uncheckedHexes = list(candidateHexes.values())
+        while uncheckedHexes:
+            nextHex = uncheckedHexes.pop()
+            distance = distances.get(nextHex.hexIndex)
+            if distance is None:
+                continue
+            if distance == 0:
+                isSupported = self.isBorderHex(nextHex)
+            else:
+                isSupported = any(distances.get(neighbour.hexIndex) == distance - 1 for neighbour in nextHex.getNeighbours())
+            if not isSupported:
+                withdrawDistance(nextHex.hexIndex)
+                candidateHexes[nextHex.hexIndex] = nextHex
+                for neighbour in nextHex.getNeighbours():
+                    if distances.get(neighbour.hexIndex) == distance + 1:
+                        uncheckedHexes.append(neighbour)
+        # Seed unlabelled hexes and new edge hexes from what surrounds them, then spread the lower labels
+        labelQueue = []
+        queueOrder = count()
+        for hexIndex, nextHex in candidateHexes.items():
+            if self.isBorderHex(nextHex):
+                distance = 0
+            else:
+                neighbourDistances = [distances[neighbour.hexIndex] for neighbour in nextHex.getNeighbours() if neighbour.hexIndex in distances]
+                distance = min(neighbourDistances) + 1 if neighbourDistances else None
+            if distance is not None and (not hexIndex in distances or distance < distances[hexIndex]):
+                previousDistances.setdefault(hexIndex, distances.get(hexIndex))
+                distances[hexIndex] = distance
+                heapq.heappush(labelQueue, (distance, next(queueOrder), nextHex))
+        while labelQueue:
+            distance, _, nextHex = heapq.heappop(labelQueue)
+            if distances.get(nextHex.hexIndex) != distance:
+                continue
+            for neighbour in nextHex.getNeighbours():
+                if neighbour.hexIndex in self.hexes and distances.get(neighbour.hexIndex, distance + 2) > distance + 1:
+                    previousDistances.setdefault(neighbour.hexIndex, distances.get(neighbour.hexIndex))
+                    distances[neighbour.hexIndex] = distance + 1
+                    heapq.heappush(labelQueue, (distance + 1, next(queueOrder), neighbour))
+        # Move relabelled hexes between rings
+        for hexIndex, previousDistance in previousDistances.items():
+            distance = distances.get(hexIndex)
+            if distance == previousDistance:
+                continue
+            if previousDistance is not None:
+                self.borderHexes[previousDistance].pop(hexIndex, None)
+            if distance is not None:
+                while len(self.borderHexes) <= distance:
+                    self.borderHexes.append(dict())
+                self.borderHexes[distance][hexIndex] = self.hexes[hexIndex]
+        while self.borderHexes and not self.borderHexes[-1]:
+            self.borderHexes.pop()
+
+    # Add and remove border vertices among the given points, returning those removed and those added
+    def updateBorderVertices(self, points):
+        removedBorderVertices = []
+        addedBorderVertices = []
+        for point in points:
+            if self.doesPointBorderRegion(point):
+                if not point.id in self.borderVertices:
+                    self.borderVertices[point.id] = point
+                    addedBorderVertices.append(point)
+            elif point.id in self.borderVertices:
+                removedBorderVertices.append(self.borderVertices.pop(point.id))
+        return removedBorderVertices, addedBorderVertices
+
+    # Retrace the border loops through the given points, along with any new loops starting among them
+    def updateOrderedBorderVertices(self, changedHexes, points, mesh):
+        if any(not nextHex.hexIndex in mesh.hexFaces for nextHex in changedHexes):
+            # The mesh does not cover the changed hexes, so trace every loop afresh
+            mesh = None
+            points = list(self.borderVertices.values())
+        staleLoops = dict()
+        for point in points:
+            borderList = self.vertexBorderLoops.get(point.id)
+            if borderList:
+                staleLoops[id(borderList)] = borderList
+        startingPoints = dict((point.id, point) for point in points if point.id in self.borderVertices)
+        for borderList in staleLoops.values():
+            for point in borderList:
+                del self.vertexBorderLoops[point.id]
+                if point.id in self.borderVertices:
+                    startingPoints.setdefault(point.id, point)
+        self.orderedBorderVertices[:] = [borderList for borderList in self.orderedBorderVertices if not id(borderList) in staleLoops]
+        if not mesh:
+            mesh = halfedge.createHexMesh(self.hexes.values())
+            self.borderMesh = mesh
+        isInRegion = mesh.createHexMembershipTest(self.hexes)
+        for point in startingPoints.values():
+            if not point.id in self.vertexBorderLoops:
+                self.traceBorderLoop(point, mesh, isInRegion)
+
+    # Update distances to the border for the points whose closest border vertex is affected by a change:
+    #  points new to the region, points that were closest to a removed border vertex, and points an added
+    #  border vertex is now closer to. They are found through indexes kept up to date with each change, so
+    #  the work follows the area a change affects rather than the size of the region. Distances read off a
+    #  distance field do not depend on the region's border vertices, so there only the new points are sampled.
+    def repairBorderDistances(self, changedPoints, removedBorderVertices, addedBorderVertices):
+        if self.borderDistanceHeap is None:
+            self.indexBorderDistances(changedPoints, removedBorderVertices, addedBorderVertices)
+        stalePoints = dict()
+        # Set when the point at the region's longest distance moves closer to the border or leaves
+        shortenedLargest = False
+        for point in changedPoints:
+            if any(nextHex.hexIndex in self.hexes for nextHex in point.surroundingHexes):
+                if not point.id in self.vertexBorderDistances:
+                    stalePoints[point.id] = point
+            else:
+                self.forgetClosestBorderVertex(point)
+                self.vertexCoastDirections.pop(point.id, None)
+                if self.vertexBorderDistances.pop(point.id, None) == self.largestVertexBorderDistance:
+                    shortenedLargest = True
+                if self.pointBuckets:
+                    self.pointBuckets.remove(point)
+        if self.distanceField:
+            points = list(stalePoints.values())
+            self.sampleBorderDistances(points)
+        else:
+            for point in stalePoints.values():
+                self.pointBuckets.add(point)
+            self.findPointsServedBy(removedBorderVertices, addedBorderVertices, stalePoints)
+            for borderVertex in removedBorderVertices:
+                self.borderVertexIndex.remove(borderVertex)
+            for borderVertex in addedBorderVertices:
+                self.borderVertexIndex.add(borderVertex)
+            points = list(stalePoints.values()) if self.borderVertices else []
+            closestBorderVertices, _ = self.borderVertexIndex.findNearest([(point.x, point.y) for point in points])
+            for nextPoint, closestBorderVertex in zip(points, closestBorderVertices):
+                distance = nextPoint.distanceFrom(closestBorderVertex)
+                if self.vertexBorderDistances.get(nextPoint.id) == self.largestVertexBorderDistance and distance < self.largestVertexBorderDistance:
+                    shortenedLargest = True
+                self.forgetClosestBorderVertex(nextPoint)
+                self.closestBorderVertex[ nextPoint.id ] = closestBorderVertex
+                self.servedPoints.setdefault(closestBorderVertex.id, dict())[nextPoint.id] = nextPoint
+                self.vertexBorderDistances[ nextPoint.id ] = distance
+                self.vertexCoastDirections[ nextPoint.id ] = ( (closestBorderVertex.x-nextPoint.x), (closestBorderVertex.y-nextPoint.y) )
+                if distance > self.largestVertexBorderDistance:
+                    self.largestVertexBorderDistance = distance
+        for nextPoint in points:
+            heapq.heappush(self.borderDistanceHeap, (-self.vertexBorderDistances[nextPoint.id], nextPoint.id))
+        # The region's longest distance is only looked for again if it may have shrunk
+        if shortenedLargest:
+            self.largestVertexBorderDistance = self.findLargestBorderDistance()
+        # Hexes that joined the region or have an updated point get their distances to the border again
+        staleHexes = dict()
+        for point in chain(points, changedPoints):
+            for nextHex in point.surroundingHexes:
+                if nextHex.hexIndex in self.hexes:
+                    staleHexes[nextHex.hexIndex] = nextHex
+        hexPoints = dict()
+        for nextHex in staleHexes.values():
+            for point in nextHex.points:
+                hexPoints.setdefault(point.id, point)
+        hexPoints = list(hexPoints.values())
+        if not hexPoints or not all(point.id in self.vertexBorderDistances for point in hexPoints):
+            return
+        distances = np.array([self.vertexBorderDistances[point.id] for point in hexPoints], dtype=np.float64)
+        self.assignHexBorderDistances(hexPoints, distances, list(staleHexes.values()))
+
+    # Build the indexes repairBorderDistances keeps up to date, from the distances as they were before the
+    #  given border vertices were removed and added
+    def indexBorderDistances(self, changedPoints, removedBorderVertices, addedBorderVertices):
+        self.borderDistanceHeap = [(-distance, pointId) for pointId, distance in self.vertexBorderDistances.items()]
+        heapq.heapify(self.borderDistanceHeap)
+        self.pointBuckets = None
+        self.borderVertexIndex = None
+        self.servedPoints = dict()
+        if self.distanceField:
+            return
+        # Cells about a hex across hold a few points each
+        someHex = next(iter(changedPoints)).surroundingHexes[0]
+        cellSize = 2 * someHex.centre.distanceFrom(someHex.points[0])
+        points = [point for point in self.getRegionPoints() if point.id in self.vertexBorderDistances]
+        self.pointBuckets = graph.PointBuckets(cellSize, points)
+        addedIds = set(borderVertex.id for borderVertex in addedBorderVertices)
+        previousBorderVertices = [borderVertex for borderVertex in self.borderVertices.values() if not borderVertex.id in addedIds]
+        self.borderVertexIndex = VertexIndex(previousBorderVertices + list(removedBorderVertices))
+        for point in points:
+            closestBorderVertex = self.closestBorderVertex.get(point.id)
+            if closestBorderVertex:
+                self.servedPoints.setdefault(closestBorderVertex.id, dict())[point.id] = point
+
+    def forgetClosestBorderVertex(self, point):
+        closestBorderVertex = self.closestBorderVertex.pop(point.id, None)
+        if closestBorderVertex:
+            servedPoints = self.servedPoints.get(closestBorderVertex.id)
+            if servedPoints is not None:
+                servedPoints.pop(point.id, None)
+                if not servedPoints:
+                    del self.servedPoints[closestBorderVertex.id]
+
+    # The longest distance to the border, from the top of the heap once entries for old distances are dropped
+    def findLargestBorderDistance(self):
+        heap = self.borderDistanceHeap
+        # Rebuild the heap when it is mostly stale entries
+        if len(heap) > 2 * len(self.vertexBorderDistances) + 64:
+            heap[:] = [(-distance, pointId) for pointId, distance in self.vertexBorderDistances.items()]
+            heapq.heapify(heap)
+        while heap and self.vertexBorderDistances.get(heap[0][1]) != -heap[0][0]:
+            heapq.heappop(heap)
+        return -heap[0][0] if heap else False
+
+    # Add the region points that one of the given border vertices, past or present, is at least as close to as
+    #  their recorded distance to the border. The points closest to a removed vertex are indexed. Those an added
+    #  vertex is at least as close to lie in its cell of the Voronoi diagram of the old border vertices, which
+    #  is convex but may cross water, e.g. a bay. Bisectors with the nearest old border vertices bound that cell,
+    #  and the point cells within those bounds are searched outwards from the vertex. The border vertex index
+    #  must not be updated yet.
+    def findPointsServedBy(self, removedBorderVertices, addedBorderVertices, stalePoints, boundingVertexCount=16):
+        for borderVertex in removedBorderVertices:
+            stalePoints.update(self.servedPoints.get(borderVertex.id, {}))
+        if not self.vertexBorderDistances:
+            return
+        cellSize = self.pointBuckets.cellSize
+        cellCorners = np.array([(0, 0), (cellSize, 0), (0, cellSize), (cellSize, cellSize)])
+        for borderVertex in addedBorderVertices:
+            # Each bisector leaves the points nearer another border vertex on one side. Points nearer another
+            #  added vertex are found from that vertex.
+            boundingVertices = self.borderVertexIndex.findNearby(borderVertex.x, borderVertex.y, boundingVertexCount)
+            boundingVertices.extend(vertex for vertex in addedBorderVertices if vertex is not borderVertex)
+            normals = np.array([(vertex.x - borderVertex.x, vertex.y - borderVertex.y) for vertex in boundingVertices], dtype=np.float64).reshape(-1, 2)
+            offsets = ((normals + 2 * np.array([borderVertex.x, borderVertex.y])) * normals).sum(axis=1) / 2 + 1e-6
+            # Cells are searched a ring at a time
+            searchedCells = [self.pointBuckets.getCell(borderVertex.x, borderVertex.y)]
+            visitedCells = set(searchedCells)
+            while searchedCells:
+                cellOrigins = np.array(searchedCells, dtype=np.float64) * cellSize
+                # Closest distance from the vertex to each cell
+                dx = np.maximum(np.maximum(cellOrigins[:,0] - borderVertex.x, 0), borderVertex.x - cellOrigins[:,0] - cellSize)
+                dy = np.maximum(np.maximum(cellOrigins[:,1] - borderVertex.y, 0), borderVertex.y - cellOrigins[:,1] - cellSize)
+                isNear = np.hypot(dx, dy) <= self.largestVertexBorderDistance + 1e-9
+                # Cells wholly beyond a bisector are out
+                isBeyondBisector = (np.dot(cellOrigins[:,None,:] + cellCorners, normals.T) > offsets).all(axis=1).any(axis=1)
+                nextCells = []
+                for i in np.flatnonzero(isNear & ~isBeyondBisector).tolist():
+                    cell = searchedCells[i]
+                    for point in self.pointBuckets.getCellPoints(cell).values():
+                        if point.id in self.vertexBorderDistances and point.distanceFrom(borderVertex) <= self.vertexBorderDistances[point.id] + 1e-9:
+                            stalePoints[point.id] = point
+                    for neighbour in graph.getRingCells(cell[0], cell[1], 1):
+                        if not neighbour in visitedCells and self.pointBuckets.isCellInBounds(neighbour):
+                            visitedCells.add(neighbour)
+                            nextCells.append(neighbour)
+                searchedCells = nextCells
+
     def drawRegionBorders(self, borderColor=(0.8,0.5,0.1,0.5)):
         if not self.orderedBorderVertices:
             self.findOrderedBorderVertices()
@@ -257,10 +629,16 @@ class Region():
             return True
         return False
 
-    def buildBatch(self, batch):
+    # The region's hexes as a hexset.HexSet over the ids of indexer, usually World.getHexIndexer()
+    def getHexSet(self, indexer):
+        if self.hexSet is None or self.hexSet.indexer is not indexer:
+            self.hexSet = hexset.fromDict(indexer, self.hexes)
+        return self.hexSet
+
+    def buildBatch(self, batch, drawOptions):
         print("build region")
         # Create vertex list for perimeter
-        if kytten.GetObjectfromName("cb_drawIslandBorders").get_value():
+        if drawOptions.get("drawIslandBorders"):
             self.buildRegionBorderLists(batch)
 
     def buildRegionBorderLists(self, batch, borderColor=(204,127,26,127)):
@@ -296,5 +674,143 @@ class Region():
             list.delete()
         self.border_vert_list = []
 
+#
+# Index of the border loops of a set of regions, so that regions sharing a
+# border can find it without comparing every pair of regions. Loops are
+# indexed by the ids of their vertices and by the regions on either side.
+#
+class BorderLoopIndex():
+    def __init__(self, allRegions):
+        # Region containing each hex, keyed by hexIndex
+        self.hexRegions = dict()
+        for region in allRegions:
+            for hexIndex in region.hexes:
+                self.hexRegions[hexIndex] = region
+        # Each loop's vertex list, the region that traced it and the other regions it borders
+        self.loops = []
+        self.loopOwners = []
+        self.loopNeighbours = []
+        self.vertexLoops = dict()
+        # Loop ids keyed by the id of each region bordering them from outside
+        self.regionLoops = dict()
+
+    # Register a region's ordered border loops, finding the regions on their other side
+    def addRegionLoops(self, region):
+        for borderList in region.orderedBorderVertices:
+            loopId = len(self.loops)
+            neighbourRegions = []
+            for point in borderList:
+                self.vertexLoops[point.id] = loopId
+                for neighbourHex in point.surroundingHexes:
+                    neighbourRegion = self.hexRegions.get(neighbourHex.hexIndex)
+                    if neighbourRegion and neighbourRegion is not region and not neighbourRegion in neighbourRegions:
+                        neighbourRegions.append(neighbourRegion)
+            self.loops.append(borderList)
+            self.loopOwners.append(region)
+            self.loopNeighbours.append(neighbourRegions)
+            for neighbourRegion in neighbourRegions:
+                self.regionLoops.setdefault(neighbourRegion.id, []).append(loopId)
+
+    # Border loop through a vertex, or None
+    def getLoopAtVertex(self, vertex):
+        loopId = self.vertexLoops.get(vertex.id)
+        return None if loopId is None else self.loops[loopId]
+
+    # Regions separated by a loop, its owner first
+    def getLoopRegions(self, loopId):
+        return [self.loopOwners[loopId]] + self.loopNeighbours[loopId]
+
+    # Loops traced by other regions which border the given region
+    def getSharedLoops(self, region):
+        return [self.loops[loopId] for loopId in self.regionLoops.get(region.id, [])]
+
+#
+# Nearest-neighbour index of a set of vertices that changes a few at a time.
+# It holds a KD-tree of the vertices as they were when it was last built,
+# with the vertices added and removed since kept aside, and is rebuilt once
+# those are a large enough share of the tree for the rebuild to pay for itself.
+#
+class VertexIndex():
+    def __init__(self, vertices):
+        self.rebuild(vertices)
+
+    def rebuild(self, vertices):
+        self.treeVertices = list(vertices)
+        self.treeEntries = dict((vertex.id, entry) for entry, vertex in enumerate(self.treeVertices))
+        self.tree = spatial.cKDTree([(vertex.x, vertex.y) for vertex in self.treeVertices]) if self.treeVertices else None
+        self.isRemoved = np.zeros(len(self.treeVertices), dtype=bool)
+        self.removedCount = 0
+        self.addedVertices = dict()
+
+    def getVertices(self):
+        return [vertex for entry, vertex in enumerate(self.treeVertices) if not self.isRemoved[entry]] + list(self.addedVertices.values())
+
+    def add(self, vertex):
+        entry = self.treeEntries.get(vertex.id)
+        if entry is None:
+            self.addedVertices[vertex.id] = vertex
+        elif self.isRemoved[entry]:
+            self.isRemoved[entry] = False
+            self.removedCount -= 1
+        self.rebuildIfStale()
+
+    def remove(self, vertex):
+        entry = self.treeEntries.get(vertex.id)
+        if entry is None:
+            self.addedVertices.pop(vertex.id, None)
+        elif not self.isRemoved[entry]:
+            self.isRemoved[entry] = True
+            self.removedCount += 1
+        self.rebuildIfStale()
+
+    def rebuildIfStale(self):
+        if len(self.addedVertices) + self.removedCount > max(16, len(self.treeVertices) // 8):
+            self.rebuild(self.getVertices())
+
+    # Up to count vertices nearest to (x, y), nearest first
+    def findNearby(self, x, y, count):
+        candidates = list(self.addedVertices.values())
+        keptCount = len(self.treeVertices) - self.removedCount
+        if keptCount:
+            k = min(count + self.removedCount, len(self.treeVertices))
+            _, treeEntries = self.tree.query([(x, y)], k=k)
+            candidates.extend(self.treeVertices[entry] for entry in np.ravel(treeEntries).tolist() if not self.isRemoved[entry])
+        candidates.sort(key=lambda vertex: (vertex.x - x)**2 + (vertex.y - y)**2)
+        return candidates[:count]
+
+    # Nearest vertex to each of the given coordinates, and the distances to them. Vertices are None, and
+    #  distances infinite, when the index is empty.
+    def findNearest(self, coords):
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        nearestEntries = np.full(len(coords), -1, dtype=np.intp)
+        distances = np.full(len(coords), np.inf)
+        if len(coords) and self.removedCount < len(self.treeVertices):
+            # The nearest vertices still in the tree are among the removed count plus one nearest
+            k = self.removedCount + 1
+            treeDistances, treeEntries = self.tree.query(coords, k=k)
+            treeDistances = treeDistances.reshape(len(coords), k)
+            treeEntries = treeEntries.reshape(len(coords), k)
+            firstKept = (~self.isRemoved[treeEntries]).argmax(axis=1)
+            rows = np.arange(len(coords))
+            nearestEntries = treeEntries[rows, firstKept]
+            distances = treeDistances[rows, firstKept]
+        nearestVertices = [self.treeVertices[entry] if entry >= 0 else None for entry in nearestEntries.tolist()]
+        if len(coords) and self.addedVertices:
+            addedVertices = list(self.addedVertices.values())
+            addedCoords = np.array([(vertex.x, vertex.y) for vertex in addedVertices], dtype=np.float64)
+            addedDistances = np.hypot(coords[:,None,0] - addedCoords[None,:,0], coords[:,None,1] - addedCoords[None,:,1])
+            nearestAdded = addedDistances.argmin(axis=1)
+            addedDistances = addedDistances[np.arange(len(coords)), nearestAdded]
+            for i in np.flatnonzero(addedDistances < distances).tolist():
+                nearestVertices[i] = addedVertices[nearestAdded[i]]
+            distances = np.minimum(distances, addedDistances)
+        return nearestVertices, distances
+
+# Move hexes from one region to another, updating both incrementally
+def transferHexes(hexes, fromRegion, toRegion, mesh=None):
+    hexes = list(hexes)
+    fromRegion.removeHexes(hexes, mesh)
+    toRegion.addHexes(hexes, mesh)
+
 # Initialise a generator for regions
 regionIdGen = graph.idGenerator()
@@ -0,0 +1,89 @@
+import lazyimport
+
+np = lazyimport.LazyModule("numpy")
+
+#
+# Vectorized 2D simplex noise. Follows the C implementation of snoise2 in the
+# noise library step for step in single precision, so that whole arrays of
+# coordinates produce the same values as calling noise.snoise2 on each one.
+#
+
+# Permutation table used by the noise library
+PERMUTATION = (151,160,137,91,90,15,
+    131,13,201,95,96,53,194,233,7,225,140,36,103,30,69,142,8,99,37,240,21,10,23,
+    190,6,148,247,120,234,75,0,26,197,62,94,252,219,203,117,35,11,32,57,177,33,
+    88,237,149,56,87,174,20,125,136,171,168,68,175,74,165,71,134,139,48,27,166,
+    77,146,158,231,83,111,229,122,60,211,133,230,220,105,92,41,55,46,245,40,244,
+    102,143,54,65,25,63,161,1,216,80,73,209,76,132,187,208,89,18,169,200,196,
+    135,130,116,188,159,86,164,100,109,198,173,186,3,64,52,217,226,250,124,123,
+    5,202,38,147,118,126,255,82,85,212,207,206,59,227,47,16,58,17,182,189,28,42,
+    223,183,170,213,119,248,152,2,44,154,163,70,221,153,101,155,167,43,172,9,
+    129,22,39,253,19,98,108,110,79,113,224,232,178,185,112,104,218,246,97,228,
+    251,34,242,193,238,210,144,12,191,179,162,241,81,51,145,235,249,14,239,107,
+    49,192,214,31,181,199,106,157,184,84,204,176,115,121,50,45,127,4,150,254,
+    138,236,205,93,222,114,67,29,24,72,243,141,128,195,78,66,215,61,156,180)
+
+# x and y components of the first twelve 3D gradients, the only ones 2D noise uses
+GRADIENTS = ((1,1),(-1,1),(1,-1),(-1,-1),(1,0),(-1,0),(1,0),(-1,0),(0,1),(0,-1),(0,1),(0,-1))
+
+# Skew and unskew factors for two dimensions
+F2 = 0.3660254037844386
+G2 = 0.21132486540518713
+
+# Gradient components looked up directly from a hashed permutation index
+def createGradientTables():
+    perm = np.array(PERMUTATION * 2, dtype=np.intp)
+    gradients = np.array(GRADIENTS, dtype=np.float32)
+    return perm, gradients[perm % 12, 0], gradients[perm % 12, 1]
+
+# Simplex noise for arrays of x and y coordinates, between roughly -1 and 1
+def noise2(x, y):
+    f32 = np.float32
+    perm, gradientXs, gradientYs = createGradientTables()
+    x = np.asarray(x, dtype=np.float32)
+    y = np.asarray(y, dtype=np.float32)
+    # Skew into simplex cell space to find the cell's origin
+    s = (x + y) * f32(F2)
+    i = np.floor(x + s)
+    j = np.floor(y + s)
+    t = (i + j) * f32(G2)
+    # Offsets from each of the triangle's three corners
+    xx0 = x - (i - t)
+    yy0 = y - (j - t)
+    upper = xx0 > yy0
+    i1 = upper.astype(np.float32)
+    j1 = f32(1) - i1
+    xx1 = xx0 - i1 + f32(G2)
+    yy1 = yy0 - j1 + f32(G2)
+    xx2 = xx0 + f32(G2 * 2.0) - f32(1)
+    yy2 = yy0 + f32(G2 * 2.0) - f32(1)
+    # Hashed permutation index of each corner, picking its gradient
+    I = i.astype(np.intp) & 255
+    J = j.astype(np.intp) & 255
+    corners = ((xx0, yy0, I + perm[J]),
+        (xx1, yy1, I + upper + perm[J + ~upper]),
+        (xx2, yy2, I + 1 + perm[J + 1]))
+    total = np.zeros(x.shape, dtype=np.float32)
+    for xx, yy, hashed in corners:
+        # Corners further than the kernel radius contribute nothing
+        f = np.maximum(f32(0.5) - xx*xx - yy*yy, f32(0))
+        total += f*f*f*f * (gradientXs[hashed]*xx + gradientYs[hashed]*yy)
+    return total * f32(70)
+
+# Fractal sum of simplex noise over octaves, as noise.snoise2(x, y, octaves, persistence, lacunarity)
+def fbm2(x, y, octaves=1, persistence=0.5, lacunarity=2.0):
+    f32 = np.float32
+    x = np.asarray(x, dtype=np.float32)
+    y = np.asarray(y, dtype=np.float32)
+    if octaves == 1:
+        return noise2(x, y)
+    freq = f32(1)
+    amp = f32(1)
+    maxAmp = f32(0)
+    total = np.zeros(np.broadcast(x, y).shape, dtype=np.float32)
+    for octave in range(octaves):
+        total = total + noise2(x * freq, y * freq) * amp
+        maxAmp = maxAmp + amp
+        freq = freq * f32(lacunarity)
+        amp = amp * f32(persistence)
+    return total / maxAmp
@@ -1,10 +1,17 @@
 import math
 import random
 
-from noise import snoise2
-
 import graph
 import regions
+import simplex
+import lazyimport
+
+np = lazyimport.LazyModule("numpy")
+multiprocessing = lazyimport.LazyModule("multiprocessing")
+shared_memory = lazyimport.LazyModule("multiprocessing.shared_memory")
+
+# Pixels generated at once when creating a full noise field, bounding the memory of temporaries
+NOISE_BAND_PIXELS = 1 << 18
 
 def assignHexMapAltitudes(hexMap):
     # Iterate over hexes in may
@@ -21,34 +28,67 @@ def assignHexMapAltitudes(hexMap):
         nextHex.centre.altitude = cumulativeAltitude/len(nextHex.points)
         #print("Hex %s centre altitude is %f" % (str(nextHex.hexIndex), nextHex.centre.altitude))
 
-def assignRegionVertexAltitudesFromCoast(hexRegion, noiseArray):
+# Altitudes rise from zero at the coast to one at the region's furthest point from it, modulated by noise.
+#  The region is handled as arrays: its points are listed once, and the altitudes of points without one,
+#  their noise and each hex's centre average are found for all of them together. Given the region's
+#  hexgrid.HexGrid, altitudes are read and written straight through its arrays.
+def assignRegionVertexAltitudesFromCoast(hexRegion, noiseSource, grid=None):
     #print("Assigning region vertex altitudes")
     minimumAltitude = 0.0
-    for nextHex in hexRegion.hexes.values():
-        #print("Altitudes for hex %s " % (str(nextHex.hexIndex)))
-        altitudes = []
+    hexList = list(hexRegion.hexes.values())
+    if not hexList:
+        return
+    # The region's points, each listed once, and the position of each hex's points among them
+    pointPositions = dict()
+    points = []
+    hexPointPositions = []
+    for nextHex in hexList:
+        positions = []
         for point in nextHex.points:
-            if not point.altitude:
-                closestBorderVertex = hexRegion.closestBorderVertex[ point.id ]
-                distanceFromCoast = point.distanceFrom(closestBorderVertex)
-                point.directionToCoast = ( (closestBorderVertex.x-point.x), (closestBorderVertex.y-point.y) )
-                #print("Altitude: %f/%f" % (distanceFromCoast, largestDist))
-                # Create coastal altitudes of zero which increase at an increasingly rate towards 1 for highest point in region
-                point.altitude = 0 if hexRegion.largestVertexBorderDistance == 0 else (distanceFromCoast)/(hexRegion.largestVertexBorderDistance)
-
-                point.altitude += minimumAltitude
-
-                # Add some randomness
-                if noiseArray:
-                    # Set noise between 0.5 and 1, highest probability is around 0.75
-                    noise = ((noiseArray[int(point.y)-1][int(point.x)]) / 2) + 0.75
-                    #print("Noise:")
-                    #print(noise)
-                    point.altitude *= noise
-
-            altitudes.append( point.altitude )
-        nextHex.centre.altitude = sum(altitudes)/len(altitudes)
-        #print("  Altitudes: %s, centre: %s" % (str(altitudes), str(nextHex.centre.altitude)))
+            position = pointPositions.get(point.id)
+            if position is None:
+                position = pointPositions[point.id] = len(points)
+                points.append(point)
+            positions.append(position)
+        hexPointPositions.append(positions)
+    hexPointPositions = np.array(hexPointPositions, dtype=np.intp)
+    if grid:
+        vertexIds = np.array([point.id for point in points], dtype=np.intp)
+        altitudes = grid.vertexAltitudes[vertexIds]
+        # Points without an altitude, or with one of zero, are assigned one
+        unassigned = np.flatnonzero(np.isnan(altitudes) | (altitudes == 0))
+        xs, ys = grid.vertexCoords[vertexIds[unassigned]].T
+    else:
+        altitudes = np.array([point.altitude or 0.0 for point in points], dtype=np.float64)
+        unassigned = np.array([i for i, point in enumerate(points) if not point.altitude], dtype=np.intp)
+        xs = np.array([points[i].x for i in unassigned.tolist()], dtype=np.float64)
+        ys = np.array([points[i].y for i in unassigned.tolist()], dtype=np.float64)
+    unassignedPoints = [points[i] for i in unassigned.tolist()]
+    distancesFromCoast = np.array([hexRegion.vertexBorderDistances[point.id] for point in unassignedPoints], dtype=np.float64)
+    for point in unassignedPoints:
+        point.directionToCoast = hexRegion.vertexCoastDirections[ point.id ]
+    # Create coastal altitudes of zero which increase at an increasingly rate towards 1 for highest point in region
+    if hexRegion.largestVertexBorderDistance == 0:
+        newAltitudes = np.zeros(len(unassignedPoints))
+    else:
+        newAltitudes = distancesFromCoast / hexRegion.largestVertexBorderDistance
+    newAltitudes += minimumAltitude
+    # Add some randomness
+    if noiseSource is not None and len(unassignedPoints):
+        # Set noise between 0.5 and 1, highest probability is around 0.75
+        noise = (noiseSource.sample(xs.astype(np.int64), ys.astype(np.int64) - 1) / 2) + 0.75
+        newAltitudes *= noise
+    altitudes[unassigned] = newAltitudes
+    # Hex centres take the average altitude of their points
+    centreAltitudes = altitudes[hexPointPositions].sum(axis=1) / hexPointPositions.shape[1]
+    if grid:
+        grid.vertexAltitudes[vertexIds[unassigned]] = newAltitudes
+        grid.vertexAltitudes[grid.centreVertexIndex(np.array([nextHex.hexId for nextHex in hexList], dtype=np.intp))] = centreAltitudes
+    else:
+        for point, altitude in zip(unassignedPoints, newAltitudes.tolist()):
+            point.altitude = altitude
+        for nextHex, altitude in zip(hexList, centreAltitudes.tolist()):
+            nextHex.centre.altitude = altitude
 
 def assignEqualAltitudes(hexRegion):
     for nextHex in hexRegion.hexes.values():
@@ -56,42 +96,91 @@ def assignEqualAltitudes(hexRegion):
             point.altitude = 1
         nextHex.centre.altitude = 1
 
-def assignNoisyAltitudes(hexRegion, noiseArray):
+def assignNoisyAltitudes(hexRegion, noiseSource):
     for nextHex in hexRegion.hexes.values():
         cumulativeAltitude = 0
-        for point in nextHex.points:
+        noiseValues = noiseSource.sample([int(point.x) for point in nextHex.points], [int(point.y)-1 for point in nextHex.points]).tolist()
+        for point, noise in zip(nextHex.points, noiseValues):
             # Set noise between 0.5 and 1, highest probability is around 0.75
-            point.altitude = ((noiseArray[int(point.y)-1][int(point.x)]) / 4) + 0.75
+            point.altitude = (noise / 4) + 0.75
             cumulativeAltitude += point.altitude
         nextHex.centre.altitude = cumulativeAltitude / float(len(nextHex.points))
 
-def createNoiseList(width, height, inBytes=False):
-    octaves = 4
+# Array of fractal simplex noise with one value per pixel, indexed [y][x], between roughly -1 and 1.
+#  Values are single precision, as the noise is computed. The field is generated in bands of rows,
+#  spread over a pool of processes when processes > 1; every pixel is computed independently so
+#  the result is the same for any number of processes.
+def createNoiseArray(width, height, octaves=4, processes=1, pixelsPerBand=NOISE_BAND_PIXELS):
+    bandRows = max(1, pixelsPerBand // max(width, 1))
+    bands = [(rowStart, min(rowStart + bandRows, height)) for rowStart in range(0, height, bandRows)]
+    if processes <= 1 or len(bands) <= 1:
+        noiseArray = np.empty((height, width), dtype=np.float32)
+        for rowStart, rowEnd in bands:
+            noiseArray[rowStart:rowEnd] = createNoiseBand(width, octaves, rowStart, rowEnd)
+        return noiseArray
+    # Workers write their bands straight into one shared block, which is copied out once at the end
+    sharedBlock = shared_memory.SharedMemory(create=True, size=max(width * height * 4, 1))
+    try:
+        with multiprocessing.Pool(processes) as pool:
+            pool.map(fillSharedNoiseBand, [(sharedBlock.name, width, height, octaves, rowStart, rowEnd) for rowStart, rowEnd in bands])
+        noiseArray = np.ndarray((height, width), dtype=np.float32, buffer=sharedBlock.buf).copy()
+    finally:
+        sharedBlock.close()
+        sharedBlock.unlink()
+    return noiseArray
+
+def createNoiseBand(width, octaves, rowStart, rowEnd):
     freq = 8.0 * octaves
-    # minZ= 0
-    # maxZ = 0
-    # cumulativeZ = 0
-    # count = 0
-    texels = [] #[0 for n in range(width*height)]
-    for y in range(height):
-        row = []
-        for x in range(width):
-            #z = int(snoise2(x / freq, y / freq, octaves) * 127.0 + 128.0)
-            # Noise between 0 and 1
-            z = snoise2(x / freq, y / freq, octaves)
-            if inBytes:
-                z = struct.pak('<B', z & 0xFFFF)
+    ys, xs = np.mgrid[rowStart:rowEnd, 0:width]
+    return simplex.fbm2(xs / freq, ys / freq, octaves)
+
+# Pool worker filling rows [rowStart, rowEnd) of a noise field held in shared memory
+def fillSharedNoiseBand(band):
+    sharedName, width, height, octaves, rowStart, rowEnd = band
+    sharedBlock = shared_memory.SharedMemory(name=sharedName)
+    try:
+        noiseArray = np.ndarray((height, width), dtype=np.float32, buffer=sharedBlock.buf)
+        noiseArray[rowStart:rowEnd] = createNoiseBand(width, octaves, rowStart, rowEnd)
+        del noiseArray
+    finally:
+        sharedBlock.close()
+
+# Noise evaluated only at the pixels it is asked for. Values match createNoiseArray(width, height)[y][x],
+#  with pixel coordinates wrapping around the world as array indices would. Sampled values are kept,
+#  as sorted arrays of flat pixel indices and their noise, so each pixel is only evaluated once.
+#  Given a noisecache.NoiseCache, the whole field is instead read from the cache, generating it there once.
+class NoiseSource():
+    def __init__(self, width, height, octaves=4, noiseCache=None):
+        self.width = width
+        self.height = height
+        self.octaves = octaves
+        self.freq = 8.0 * octaves
+        self.sampledPixels = np.empty(0, dtype=np.int64)
+        self.sampledNoise = np.empty(0, dtype=np.float64)
+        self.cachedField = None
+        if noiseCache:
+            self.cachedField = noiseCache.getNoiseArray(width, height, octaves)
+
+    # Noise at each pixel (xs[i], ys[i]), evaluating any that have not been sampled before in one batch
+    def sample(self, xs, ys):
+        if self.cachedField is not None:
+            return self.cachedField[np.asarray(ys, dtype=np.int64) % self.height, np.asarray(xs, dtype=np.int64) % self.width].astype(np.float64)
+        pixels = (np.asarray(ys, dtype=np.int64) % self.height) * self.width + np.asarray(xs, dtype=np.int64) % self.width
+        uniquePixels, inverse = np.unique(pixels, return_inverse=True)
+        positions = np.searchsorted(self.sampledPixels, uniquePixels)
+        isSampled = positions < len(self.sampledPixels)
+        isSampled[isSampled] = self.sampledPixels[positions[isSampled]] == uniquePixels[isSampled]
+        newPixels = uniquePixels[~isSampled]
+        if len(newPixels):
+            newYs, newXs = np.divmod(newPixels, self.width)
+            newNoise = simplex.fbm2(newXs / self.freq, newYs / self.freq, self.octaves).astype(np.float64)
+            self.sampledPixels = np.concatenate((self.sampledPixels, newPixels))
+            self.sampledNoise = np.concatenate((self.sampledNoise, newNoise))
+            order = np.argsort(self.sampledPixels, kind='stable')
+            self.sampledPixels = self.sampledPixels[order]
+            self.sampledNoise = self.sampledNoise[order]
+            positions = np.searchsorted(self.sampledPixels, uniquePixels)
+        return self.sampledNoise[positions][inverse.reshape(pixels.shape)]
 
-            # if z < minZ:
-            #   minZ = z
-            # if z > maxZ:
-            #   maxZ = z
-            # cumulativeZ += z
-            # count += 1
-            
-            row.append(z)
-        texels.append(row)
-    # print("minZ: " + str(minZ))
-    # print("maxZ: " + str(maxZ))
-    # print("Average Z: " + (str(cumulativeZ/count)))
-    return texels
+    def totalSampled(self):
+        return len(self.sampledPixels)
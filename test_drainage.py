@@ -0,0 +1,60 @@
+import pytest
+
+import drainage
+
+# Hexes from a land hex down to where it stops draining, following drainingNeighbour within the land
+def findRouteDownstream(nextHex, land):
+    route = [nextHex]
+    while True:
+        drainingHex = route[-1].drainingNeighbour
+        if not drainingHex or drainingHex is route[-1] or not drainingHex.hexIndex in land.region.hexes:
+            return route
+        route.append(drainingHex)
+
+def test_forest_slices_match_upstream_walks(maskedWorld):
+    for land in maskedWorld.islands:
+        forest = land.drainageForest
+        assert sorted(nextHex.hexIndex for nextHex in forest.hexes) == sorted(land.region.hexes)
+        upstreamHexes = dict((hexIndex, set()) for hexIndex in land.region.hexes)
+        for nextHex in land.region.hexes.values():
+            route = findRouteDownstream(nextHex, land)
+            assert route[-1] in land.outflows | land.sinks
+            assert forest.getTerminatingHex(nextHex) is route[-1]
+            for downstreamHex in route[1:]:
+                upstreamHexes[downstreamHex.hexIndex].add(nextHex.hexIndex)
+        for nextHex in land.region.hexes.values():
+            drainedAbove = forest.getHexesDrainedAbove(nextHex)
+            assert [drainedHex.hexIndex for drainedHex in drainedAbove] == [drainedHex.hexIndex for drainedHex in nextHex.hexesDrainedAbove]
+            assert set(drainedHex.hexIndex for drainedHex in drainedAbove) == upstreamHexes[nextHex.hexIndex]
+            assert nextHex.upstreamCount == len(upstreamHexes[nextHex.hexIndex])
+            assert all(forest.drainsThrough(drainedHex, nextHex) for drainedHex in drainedAbove)
+        for basin in land.drainageBasins:
+            assert [basinHex.hexIndex for basinHex in basin.hexes] == [basinHex.hexIndex for basinHex in drainage.findHexesDrainedAbove(basin.terminatingHex)]
+            assert basin.getTotalHexes() == len(basin.hexes)
+
+# Every land hex drains along a route, without cycles, to an outflow into water or to a sink
+def assertDrainageTerminates(land):
+    forest = land.drainageForest
+    assert sorted(nextHex.hexIndex for nextHex in forest.hexes) == sorted(land.region.hexes)
+    for nextHex in land.region.hexes.values():
+        route = findRouteDownstream(nextHex, land)
+        assert len(route) == len(set(routeHex.hexIndex for routeHex in route))
+        assert route[-1] in land.outflows | land.sinks
+    for outflowHex in land.outflows:
+        assert outflowHex.drainingNeighbour.water
+
+@pytest.mark.parametrize("maskedWorld", [{"fillDepressions": True, "minLakeDepth": float('inf'), "minLakeArea": float('inf')}], indirect=True)
+def test_breaching_every_depression_leaves_no_sinks(maskedWorld):
+    for land in maskedWorld.islands:
+        assert not land.sinks
+        assertDrainageTerminates(land)
+
+def test_breaching_keeps_only_lake_sinks(makeMaskedWorld):
+    unbreachedWorld = makeMaskedWorld()
+    testWorld = makeMaskedWorld(fillDepressions=True)
+    assert sum(len(land.sinks) for land in testWorld.islands) < sum(len(land.sinks) for land in unbreachedWorld.islands)
+    for land in testWorld.islands:
+        fillLevels, _ = drainage.floodFromCoast(land.region.hexes)
+        lakeHexes = drainage.findLakeHexes(land.region.hexes, fillLevels, testWorld.minLakeDepth, testWorld.minLakeArea)
+        assert all(sinkHex.hexIndex in lakeHexes or not sinkHex.hexIndex in fillLevels for sinkHex in land.sinks)
+        assertDrainageTerminates(land)
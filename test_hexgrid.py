@@ -0,0 +1,48 @@
+import random
+
+import pytest
+
+import world
+
+# Label of each (hexIndex, point number) pair, naming the pair at which that point object was first met.
+#  Two pairs have the same label exactly when their hexes share the point.
+def labelSharedPoints(gridWorld):
+    firstSeen = dict()
+    labels = dict()
+    for hexIndex in sorted(gridWorld.hexMap):
+        for pointNumber, point in enumerate(gridWorld.hexMap[hexIndex].points):
+            labels[(hexIndex, pointNumber)] = firstSeen.setdefault(id(point), (hexIndex, pointNumber))
+    return labels
+
+# Topology of a grid in terms of hex indices and point labels, comparable between grid backends
+def describeGrid(gridWorld):
+    labels = labelSharedPoints(gridWorld)
+    pointsByLabel = dict()
+    for hexIndex, nextHex in gridWorld.hexMap.items():
+        for pointNumber, point in enumerate(nextHex.points):
+            pointsByLabel[labels[(hexIndex, pointNumber)]] = (point, nextHex)
+    labelsById = dict((id(point), label) for label, (point, _) in pointsByLabel.items())
+    neighbours = dict((hexIndex, [neighbour.hexIndex if neighbour else None for neighbour in nextHex.neighbours]) for hexIndex, nextHex in gridWorld.hexMap.items())
+    surroundingHexes = dict((label, sorted(surroundingHex.hexIndex for surroundingHex in point.surroundingHexes)) for label, (point, _) in pointsByLabel.items())
+    neighbouringVertices = dict((label, sorted(labelsById[id(neighbour)] for neighbour in point.neighbouringVertices)) for label, (point, _) in pointsByLabel.items())
+    centreHexes = dict((hexIndex, [centreHex.hexIndex for centreHex in nextHex.centre.surroundingHexes]) for hexIndex, nextHex in gridWorld.hexMap.items())
+    return labels, neighbours, surroundingHexes, neighbouringVertices, centreHexes
+
+@pytest.mark.parametrize("hexesInOddRow", [7, 10])
+def test_array_grid_matches_object_grid(hexesInOddRow):
+    gridWorlds = []
+    for useArrayGrid in (False, True):
+        random.seed(3)
+        gridWorlds.append(world.World(800, 600, hexesInOddRow, useArrayGrid=useArrayGrid))
+    objectWorld, arrayWorld = gridWorlds
+    assert sorted(objectWorld.hexMap) == sorted(arrayWorld.hexMap)
+    objectGrid, arrayGrid = describeGrid(objectWorld), describeGrid(arrayWorld)
+    for objectPart, arrayPart in zip(objectGrid, arrayGrid):
+        assert objectPart == arrayPart
+    # Jitter is drawn differently by each builder, so points only agree to within the jitter of both
+    maxJitter = 2 * 0.2 * objectWorld.hexMap[(0, 0)].radius + 1e-9
+    for hexIndex, objectHex in objectWorld.hexMap.items():
+        arrayHex = arrayWorld.hexMap[hexIndex]
+        assert arrayHex.radius == pytest.approx(objectHex.radius)
+        for objectPoint, arrayPoint in zip([objectHex.centre] + objectHex.points, [arrayHex.centre] + arrayHex.points):
+            assert abs(arrayPoint.x - objectPoint.x) <= maxJitter and abs(arrayPoint.y - objectPoint.y) <= maxJitter
@@ -0,0 +1,55 @@
+import random
+
+import hexset
+import regions
+
+def createRandomHexDicts(hexList, rng, count=6):
+    return [dict((nextHex.hexIndex, nextHex) for nextHex in rng.sample(hexList, rng.randint(0, len(hexList)))) for _ in range(count)]
+
+def test_set_algebra_matches_dict_keys(smallWorld):
+    indexer = smallWorld.getHexIndexer()
+    hexList = smallWorld.getHexList()
+    rng = random.Random(0)
+    hexDicts = createRandomHexDicts(hexList, rng)
+    for first in hexDicts:
+        firstSet = hexset.fromDict(indexer, first)
+        assert firstSet.area() == len(first)
+        assert firstSet.toDict() == first
+        assert all(nextHex in firstSet for nextHex in first.values())
+        assert all((nextHex.hexIndex in firstSet) == (nextHex.hexIndex in first) for nextHex in hexList)
+        for second in hexDicts:
+            secondSet = hexset.fromDict(indexer, second)
+            assert set((firstSet | secondSet).toDict()) == set(first) | set(second)
+            assert set((firstSet & secondSet).toDict()) == set(first) & set(second)
+            assert set((firstSet - secondSet).toDict()) == set(first) - set(second)
+            assert set((firstSet ^ secondSet).toDict()) == set(first) ^ set(second)
+            assert firstSet.isSubsetOf(secondSet) == (set(first) <= set(second))
+            assert firstSet.intersects(secondSet) == bool(set(first) & set(second))
+            assert (firstSet == secondSet) == (set(first) == set(second))
+
+def test_add_and_remove_match_dict_updates(smallWorld):
+    indexer = smallWorld.getHexIndexer()
+    hexList = smallWorld.getHexList()
+    rng = random.Random(1)
+    hexes = dict()
+    members = hexset.HexSet(indexer)
+    for _ in range(200):
+        nextHex = rng.choice(hexList)
+        if rng.random() < 0.5:
+            hexes[nextHex.hexIndex] = nextHex
+            members.add(nextHex)
+        else:
+            hexes.pop(nextHex.hexIndex, None)
+            members.remove(nextHex.hexIndex)
+        assert members.toDict() == hexes
+
+def test_region_hex_set_is_cached_and_follows_changes(smallWorld):
+    indexer = smallWorld.getHexIndexer()
+    hexList = smallWorld.getHexList()
+    region = regions.Region(dict())
+    emptySet = region.getHexSet(indexer)
+    assert emptySet.isEmpty()
+    assert region.getHexSet(indexer) is emptySet
+    region.addHexes(hexList[:5])
+    assert region.getHexSet(indexer) is emptySet
+    assert emptySet.toDict() == region.hexes
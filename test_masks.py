@@ -0,0 +1,60 @@
+import os
+import struct
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import masks
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 32 bit BI_BITFIELDS bitmap of bottom-up (height, width, 4) pixel bytes, with the given red, green and blue masks
+def writeBitfieldsBitmap(fileName, pixels, channelMasks):
+    height, width = pixels.shape[:2]
+    pixelOffset = masks.BMP_MASKS_OFFSET + struct.calcsize(masks.BMP_MASKS_FORMAT)
+    with open(fileName, 'wb') as bitmapFile:
+        bitmapFile.write(struct.pack('<2sIHHI', b'BM', pixelOffset + pixels.nbytes, 0, 0, pixelOffset))
+        bitmapFile.write(struct.pack('<IiiHHIIiiII', 40, width, height, 1, 32, masks.BMP_BITFIELDS, pixels.nbytes, 0, 0, 0, 0))
+        bitmapFile.write(struct.pack(masks.BMP_MASKS_FORMAT, *channelMasks))
+        bitmapFile.write(pixels.tobytes())
+
+def test_jpg_mask_loads_without_display():
+    pytest.importorskip("PIL")
+    environment = dict((key, value) for key, value in os.environ.items() if key not in ("DISPLAY", "WAYLAND_DISPLAY"))
+    script = ("import sys, masks; mask = masks.loadMask('groundtruth5.jpg'); "
+        "assert not 'pyglet.gl' in sys.modules; print(mask.width, mask.height)")
+    result = subprocess.run([sys.executable, "-c", script], cwd=PACKAGE_DIR, env=environment, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    decoded = masks.loadMask(os.path.join(PACKAGE_DIR, "groundtruth5.jpg"))
+    mapped = masks.loadMask(os.path.join(PACKAGE_DIR, "groundtruth5.bmp"))
+    assert isinstance(decoded, masks.DecodedMask)
+    assert result.stdout.split() == [str(mapped.width), str(mapped.height)]
+    # JPG compression blurs the coastline, so only nearly every pixel agrees on land and water
+    assert np.mean((decoded.rows > 127) == (np.asarray(mapped.rows) > 127)) > 0.99
+
+def test_palettised_bitmap_is_decoded(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    mapped = masks.loadMask(os.path.join(PACKAGE_DIR, "groundtruth4.bmp"))
+    fileName = str(tmp_path / "palettised.bmp")
+    Image.fromarray(np.ascontiguousarray(mapped.rows[::-1])).convert('P').save(fileName)
+    assert masks.readMappableBitmapHeader(fileName) is None
+    decoded = masks.loadMask(fileName)
+    assert isinstance(decoded, masks.DecodedMask)
+    assert np.array_equal(decoded.rows, mapped.rows)
+
+def test_bitfields_bitmap_reads_red_from_its_mask(tmp_path):
+    pixels = np.random.RandomState(0).randint(0, 256, size=(7, 5, 4)).astype(np.uint8)
+    for redByte in range(4):
+        fileName = str(tmp_path / ("red%d.bmp" % redByte))
+        otherBytes = [byte for byte in range(4) if byte != redByte]
+        writeBitfieldsBitmap(fileName, pixels, [0xFF << 8*byte for byte in [redByte] + otherBytes[:2]])
+        mask = masks.loadMask(fileName)
+        assert isinstance(mask, masks.BitmapMask)
+        assert np.array_equal(mask.rows, pixels[:, :, redByte])
+
+def test_bitfields_bitmap_with_partial_byte_masks_is_not_mapped(tmp_path):
+    fileName = str(tmp_path / "rgb10.bmp")
+    writeBitfieldsBitmap(fileName, np.zeros((3, 3, 4), dtype=np.uint8), [0x3FF00000, 0x000FFC00, 0x000003FF])
+    assert masks.readMappableBitmapHeader(fileName) is None
@@ -0,0 +1,88 @@
+import random
+
+import pytest
+
+import regions
+
+# Both grid backends with both coast distance engines
+WORLD_OPTIONS = [{"useArrayGrid": useArrayGrid, "coastDistanceEngine": engine} for useArrayGrid in (False, True) for engine in ("kdtree", "raster")]
+
+# Border data of a region built from scratch, with its hexes' distances read before they are overwritten
+def getBorderData(region):
+    hexDistances = dict((hexIndex, (nextHex.shortestDistanceToBorder, nextHex.furthestDistanceToBorder)) for hexIndex, nextHex in region.hexes.items())
+    return region.hexBorderDistances.copy(), set(region.borderVertices), region.vertexBorderDistances.copy(), region.largestVertexBorderDistance, hexDistances
+
+def recomputeBorderData(region, distanceField=None):
+    freshRegion = regions.Region(region.hexes)
+    freshRegion.findBorderHexes()
+    if distanceField:
+        freshRegion.findBorderVertices()
+        freshRegion.calculateBorderDistancesFromField(distanceField)
+    else:
+        freshRegion.calculateAllClosestBorderVertex()
+    return getBorderData(freshRegion)
+
+def assertSameBorderData(incremental, full):
+    assert incremental[0] == full[0]
+    assert incremental[1] == full[1]
+    assert set(incremental[2]) == set(full[2])
+    for pointId, distance in full[2].items():
+        assert incremental[2][pointId] == pytest.approx(distance, abs=1e-9)
+    assert incremental[3] == pytest.approx(full[3], abs=1e-9)
+    for hexIndex, distances in full[4].items():
+        assert incremental[4][hexIndex] == pytest.approx(distances, abs=1e-9)
+
+# Randomly remove hexes, or clusters of hexes at the border, and add back hexes around the region
+def changeRegionRandomly(region, rng, mesh):
+    hexList = list(region.hexes.values())
+    if rng.random() < 0.5:
+        if rng.random() < 0.5:
+            changedHexes = rng.sample(hexList, min(4, len(hexList)-1))
+        else:
+            changedHexes = [rng.choice(list(region.borderHexes[0].values()))]
+            changedHexes.extend(neighbour for neighbour in changedHexes[0].getNeighbours()[:rng.randint(0, 6)] if neighbour.hexIndex in region.hexes)
+            changedHexes = list(dict((nextHex.hexIndex, nextHex) for nextHex in changedHexes).values())[:len(hexList)-1]
+        region.removeHexes(changedHexes, mesh)
+    else:
+        nextHex = rng.choice(hexList)
+        region.addHexes(nextHex.getNeighbours() + [neighbour for neighbour in rng.choice(nextHex.getNeighbours()).getNeighbours()], mesh)
+
+@pytest.mark.parametrize("maskedWorld", WORLD_OPTIONS, indirect=True,
+    ids=["%s-%s" % ("array" if options["useArrayGrid"] else "object", options["coastDistanceEngine"]) for options in WORLD_OPTIONS])
+def test_incremental_border_update_matches_full_recompute(maskedWorld):
+    mesh = maskedWorld.getHalfEdgeMesh()
+    lands = [land for land in maskedWorld.islands if len(land.region.hexes) > 30]
+    for trial in range(12):
+        rng = random.Random(trial)
+        region = regions.Region(rng.choice(lands).region.hexes)
+        region.findBorderHexes()
+        if maskedWorld.coastDistanceField:
+            region.findBorderVertices()
+            region.calculateBorderDistancesFromField(maskedWorld.coastDistanceField)
+        else:
+            region.calculateAllClosestBorderVertex()
+        region.findOrderedBorderVertices(mesh=mesh)
+        for step in range(10):
+            changeRegionRandomly(region, rng, mesh)
+            assertSameBorderData(getBorderData(region), recomputeBorderData(region, maskedWorld.coastDistanceField))
+            assert region.distanceField is maskedWorld.coastDistanceField
+
+def test_vertex_index_matches_brute_force_after_changes(maskedWorld):
+    rng = random.Random(0)
+    allPoints = list(dict((point.id, point) for nextHex in maskedWorld.getHexList() for point in nextHex.points).values())
+    indexedPoints = dict((point.id, point) for point in rng.sample(allPoints, 200))
+    vertexIndex = regions.VertexIndex(indexedPoints.values())
+    for step in range(300):
+        point = rng.choice(allPoints)
+        if point.id in indexedPoints and rng.random() < 0.5:
+            del indexedPoints[point.id]
+            vertexIndex.remove(point)
+        else:
+            indexedPoints[point.id] = point
+            vertexIndex.add(point)
+        queries = [(rng.uniform(0, 800), rng.uniform(0, 600)) for _ in range(5)]
+        nearestVertices, distances = vertexIndex.findNearest(queries)
+        for (x, y), nearestVertex, distance in zip(queries, nearestVertices, distances.tolist()):
+            expected = min(((point.x - x)**2 + (point.y - y)**2)**0.5 for point in indexedPoints.values())
+            assert nearestVertex.id in indexedPoints
+            assert distance == pytest.approx(expected, abs=1e-9)
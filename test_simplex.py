@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+import simplex
+
+noise = pytest.importorskip("noise")
+
+# Coordinates on both sides of zero and across many simplex cells, with fractional parts of every size
+def createCoordinates(count=2000, seed=0):
+    rng = np.random.RandomState(seed)
+    return rng.uniform(-300, 300, count).astype(np.float32), rng.uniform(-300, 300, count).astype(np.float32)
+
+@pytest.mark.parametrize("octaves, persistence, lacunarity", [
+    (1, 0.5, 2.0),
+    (4, 0.5, 2.0),
+    (3, 0.3, 1.7),
+    (5, 0.8, 2.9),
+])
+def test_fbm2_matches_noise_snoise2_exactly(octaves, persistence, lacunarity):
+    xs, ys = createCoordinates()
+    values = simplex.fbm2(xs, ys, octaves, persistence, lacunarity)
+    expected = np.array([noise.snoise2(float(x), float(y), octaves, persistence, lacunarity) for x, y in zip(xs, ys)], dtype=np.float32)
+    assert values.dtype == np.float32
+    assert np.array_equal(values.view(np.uint32), expected.view(np.uint32))
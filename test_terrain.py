@@ -0,0 +1,10 @@
+import numpy as np
+
+import terrain
+
+def test_parallel_noise_matches_serial_noise():
+    # Small bands so the pool gets several, with a shorter band last
+    serialNoise = terrain.createNoiseArray(300, 97, processes=1, pixelsPerBand=3000)
+    parallelNoise = terrain.createNoiseArray(300, 97, processes=2, pixelsPerBand=3000)
+    assert parallelNoise.dtype == serialNoise.dtype == np.float32
+    assert np.array_equal(parallelNoise.view(np.uint32), serialNoise.view(np.uint32))
@@ -1,22 +1,21 @@
 import math
-import pyglet
-from pyglet.gl import *
-from pyglet import image
 import random
 
-from noise import snoise2
-
 import terrain
-import drawUtils
+import lazyimport
+
+pyglet = lazyimport.LazyModule("pyglet")
+drawUtils = lazyimport.LazyModule("drawUtils")
 
 class WeatherSystem():
-    def __init__(self, width, height, gridDivisions = 10):
+    # noise may be shared with the world, otherwise the system creates its own
+    def __init__(self, width, height, gridDivisions = 10, noise=None):
         self.systemWidth = width
         self.systemHeight = height
         self.particles = set()
         self.spawnMoistureParticles()
         #self.spatialGrid = [ [ [] for y in range(gridSize) ] for x in range(gridSize) ]
-        self.noise = terrain.createNoiseList(self.systemWidth, self.systemHeight)
+        self.noise = noise if noise is not None else terrain.NoiseSource(self.systemWidth, self.systemHeight)
 
     def updateParticles(self, deltaTime=1):
         for particle in self.particles:
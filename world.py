@@ -1,21 +1,30 @@
 import math
 import random
-import copy
-import pyglet
 import time
 from itertools import chain
 
 import hexagon
+import hexgrid
 import graph
 import regions
-import drawUtils
 import terrain
 import lands
 import weather
 import drainage
+import masks
+import distancefield
+import halfedge
+import hexset
+import lazyimport
+
+pyglet = lazyimport.LazyModule("pyglet")
+drawUtils = lazyimport.LazyModule("drawUtils")
+np = lazyimport.LazyModule("numpy")
+sparse = lazyimport.LazyModule("scipy.sparse")
+csgraph = lazyimport.LazyModule("scipy.sparse.csgraph")
 
 class World():
-    def __init__(self, worldWidth, worldHeight, hexesInOddRow=10, clipPointsToWorldLimits=True, maskImage=False, createWeather=False):
+    def __init__(self, worldWidth, worldHeight, hexesInOddRow=10, clipPointsToWorldLimits=True, maskImage=None, createWeather=False, useArrayGrid=False, maskClassifier="votes", landThreshold=0.5, noiseCache=None, coastDistanceEngine="kdtree", fillDepressions=False, minLakeDepth=0.05, minLakeArea=10):
         self.hexEdge_vertex_list = None
         self.hexCentre_vertex_list = None
         self.hexFills_vertex_list = None
@@ -26,20 +35,42 @@ class World():
         # Structures for holding hexes
         self.landHexes = dict()
         self.waterHexes = dict()
-        # Create a hex grid
+        # Create a hex grid, either from hexagon objects or backed by arrays
         self.hexMap = dict()
-        self.hexGrid = self.createHexGridFromPoints(clipPointsToWorldLimits)
-        if clipPointsToWorldLimits:
-            self.clipGridHexagonsToWorldDimensions()
+        self.grid = None
+        self.halfEdgeMesh = None
+        self.hexIndexer = None
+        if useArrayGrid:
+            self.hexGrid = self.createArrayHexGrid()
+            if clipPointsToWorldLimits:
+                self.grid.clipPointsToWorldDimensions()
+        else:
+            self.hexGrid = self.createHexGridFromPoints(clipPointsToWorldLimits)
+            if clipPointsToWorldLimits:
+                self.clipGridHexagonsToWorldDimensions()
         # Add verts to spatial grid
         self.spatialGrid = graph.SpatialGrid(0, 0, self.worldWidth, self.worldHeight, int(0.75*hexesInOddRow))
         self.addVertsToSpatialGrid()
-        # Tag hexagons/vertices according to masks
+        # Tag hexagons/vertices according to masks. The mask may be a pyglet image,
+        #  a mask from masks.loadMask or a 2D array of intensities
         self.landMask = maskImage
+        # Hexes are land either by a vote of points near their perimeter ("votes") or when the
+        #  fraction of their area covered by land reaches landThreshold ("coverage")
+        self.maskClassifier = maskClassifier
+        self.landThreshold = landThreshold
         ## Collect land and water hexagons
         self.findLandMarkedHexes()
-        # Create noise for world altitudes
-        self.noise = terrain.createNoiseList(self.worldWidth, self.worldHeight, inBytes=False)
+        # Distances to the coast come from each region's border vertices ("kdtree"), or from one
+        #  distance transform of the whole world shared by every region ("raster")
+        self.coastDistanceField = None
+        if coastDistanceEngine == "raster":
+            self.coastDistanceField = self.createCoastDistanceField()
+        # Drainage can breach depressions shallower than minLakeDepth and smaller than minLakeArea hexes
+        self.fillDepressions = fillDepressions
+        self.minLakeDepth = minLakeDepth
+        self.minLakeArea = minLakeArea
+        # Noise for world altitudes, read from noiseCache when given and otherwise only evaluated where it is sampled
+        self.noise = terrain.NoiseSource(self.worldWidth, self.worldHeight, noiseCache=noiseCache)
         # Create lands - creation process involves finding borders
         self.islands = []
         self.createLands()
@@ -47,19 +78,24 @@ class World():
         self.waters = []
         self.createWaters()
         # Use land borders to avoid recomputing the same vertex sequences
+        self.borderLoopIndex = regions.BorderLoopIndex([zone.region for zone in self.islands + self.waters])
+        for land in self.islands:
+            self.borderLoopIndex.addRegionLoops(land.region)
         for water in self.waters:
-            water.receiveBordersFromLands(self.islands)
+            water.receiveBordersFromIndex(self.borderLoopIndex)
         # Create weather system
         if createWeather:
-            self.weatherSystem = weather.WeatherSystem(worldWidth, worldHeight)
-        # Create batch renderable
-        self.batch = pyglet.graphics.Batch()
-        self.buildBatch()
+            self.weatherSystem = weather.WeatherSystem(worldWidth, worldHeight, noise=self.noise)
+        # Batch renderable is only created when a renderer attaches to the built world
+        self.batch = None
 
-    # Populate batch renderable object with vertex_lists of world features
-    def buildBatch(self):
+    # Create a batch renderable and populate it with vertex_lists of world features.
+    #  drawOptions maps feature names (e.g. "drawHexFills") to whether they are drawn
+    def buildBatch(self, drawOptions):
+        self.batch = pyglet.graphics.Batch()
         for land in self.islands:
-            land.buildBatch(self.batch)
+            land.buildBatch(self.batch, drawOptions)
+        return self.batch
 
     # Build a hex grid, hex by hex, using points of neighbouring generated hexagons where possible
     def createHexGridFromPoints(self, clipPointsToWorldLimits=True):
@@ -106,6 +142,15 @@ class World():
         print("Created a hexGrid with %d rows. Odd rows are length %d and even are %d." % (len(gridRows), len(gridRows[0]), len(gridRows[1])))
         return gridRows
 
+    # Build the hex grid as contiguous arrays, exposing rows of hexagon views in the same layout
+    def createArrayHexGrid(self):
+        self.grid = hexgrid.HexGrid(self.worldWidth, self.worldHeight, self.hexesInOddRow, jitterStrength=0.2)
+        gridRows = self.grid.getHexRows()
+        for row in gridRows:
+            for hexView in row:
+                self.hexMap[hexView.hexIndex] = hexView
+        return gridRows
+
     def getExistingNeighbours(self, gridRows, currentX, currentY):
         rowIsOdd = currentY%2 == 1
 
@@ -149,80 +194,101 @@ class World():
     # Examine mask image and tag hexagons as land or water
     def findLandMarkedHexes(self):
         print("Begun finding masked hexes")
-        if self.landMask:
-            maskImageData = self.landMask.get_image_data()
-            data = maskImageData.get_data('I', self.landMask.width)
-
-            hexCount = 0
-            for row in self.hexGrid:
-                for nextHex in row:
-                    #print("Hex " + str(hexCount))
-                    if nextHex.compareToMaskImage(data, self.landMask.width):
-                        nextHex.fillColor = (1.0,0.0,0.0,1.0)
-                        # Indicate that hex must be land
-                        nextHex.land = True
-                        self.landHexes[nextHex.hexIndex] = nextHex
-                    else:
-                        # Indicate hex is water
-                        nextHex.fillColor = (0.0,0.0,1.0,1.0)
-                        nextHex.water = True
-                        self.waterHexes[nextHex.hexIndex] = nextHex
-                    #print("hexCount: " + str(hexCount))
-                    hexCount += 1
+        if self.landMask is not None:
+            maskRows = masks.getMaskData(self.landMask)
+            hexList = self.getHexList()
+            centres, points = self.getHexGeometry()
+            if self.maskClassifier == "coverage":
+                landIndices, waterIndices = masks.classifyHexesByCoverage(maskRows, centres, points, self.landThreshold)
+            else:
+                landIndices, waterIndices = masks.classifyHexesByVotes(maskRows, centres, points)
+            for i in landIndices.tolist():
+                nextHex = hexList[i]
+                nextHex.fillColor = (1.0,0.0,0.0,1.0)
+                # Indicate that hex must be land
+                nextHex.land = True
+                self.landHexes[nextHex.hexIndex] = nextHex
+            for i in waterIndices.tolist():
+                nextHex = hexList[i]
+                # Indicate hex is water
+                nextHex.fillColor = (0.0,0.0,1.0,1.0)
+                nextHex.water = True
+                self.waterHexes[nextHex.hexIndex] = nextHex
             print("Finished finding masked hexes")
 
+    def createCoastDistanceField(self):
+        centres, _ = self.getHexGeometry()
+        isLandHex = np.array([bool(nextHex.land) for nextHex in self.getHexList()], dtype=bool)
+        return distancefield.CoastDistanceField(self.worldWidth, self.worldHeight, centres, isLandHex)
+
+    # Half-edge index of the whole hex grid, built on first use, for walking borders and other edge sequences
+    def getHalfEdgeMesh(self):
+        if not self.halfEdgeMesh:
+            if self.grid:
+                self.halfEdgeMesh = halfedge.createGridMesh(self.grid)
+            else:
+                self.halfEdgeMesh = halfedge.createHexMesh(self.getHexList())
+        return self.halfEdgeMesh
+
+    # Global hex ids, in grid order, shared by the hex sets of every region in the world
+    def getHexIndexer(self):
+        if self.hexIndexer is None:
+            self.hexIndexer = hexset.HexIndexer(self.getHexList())
+        return self.hexIndexer
+
+    # All hexes in grid order, row by row
+    def getHexList(self):
+        return [nextHex for row in self.hexGrid for nextHex in row]
+
+    # Arrays of hex centre coordinates (n, 2) and perimeter point coordinates (n, 6, 2), in grid order
+    def getHexGeometry(self):
+        if self.grid:
+            return self.grid.getCentreCoords().copy(), self.grid.vertexCoords[self.grid.hexVertices]
+        hexList = self.getHexList()
+        centres = np.array([(nextHex.centre.x, nextHex.centre.y) for nextHex in hexList])
+        points = np.array([[(point.x, point.y) for point in nextHex.points] for nextHex in hexList])
+        return centres, points
+
     def createLands(self):
-        unassignedHexes = copy.copy(self.landHexes)
-        while unassignedHexes:
-            landRegion = self.createContiguousRegion(unassignedHexes)
-            self.islands.append(lands.Land(self, landRegion, self.noise))
+        for landHexes in self.findContiguousHexGroups(self.landHexes):
+            self.islands.append(lands.Land(self, self.createColouredRegion(landHexes), self.noise))
 
     def createWaters(self):
-        unassignedHexes = copy.copy(self.waterHexes)
-        while unassignedHexes:
-            waterRegion = self.createContiguousRegion(unassignedHexes)
-            self.waters.append( lands.GeographicZone(self, waterRegion, self.noise) )
-
-    # Using dict of landHexes, floodfilling finds distinct tracts of land from which regions can be created.
-    def createContiguousRegion(self, unassignedHexes):
-        # Copy map so this dict can have keys removed without losing items from other dict
-        # Choose a new land color
+        for waterHexes in self.findContiguousHexGroups(self.waterHexes):
+            self.waters.append( lands.GeographicZone(self, self.createColouredRegion(waterHexes), self.noise) )
+
+    # Split a dict of hexes (e.g. landHexes) into dicts of hexes joined by shared edges, from which regions can be
+    #  created. Components are labelled in one pass over the half-edge mesh's adjacency. Groups come in order of
+    #  their first hex in the grid, and hold their hexes in grid order.
+    def findContiguousHexGroups(self, hexes):
+        if not hexes:
+            return []
+        mesh = self.getHalfEdgeMesh()
+        isMember = np.zeros(mesh.totalFaces, dtype=bool)
+        isMember[[mesh.hexFaces[hexIndex] for hexIndex in hexes]] = True
+        # Half-edges with member hexes on both sides join those hexes
+        hasTwin = mesh.twin != -1
+        twinFaces = mesh.face[np.where(hasTwin, mesh.twin, 0)]
+        joined = hasTwin & isMember[mesh.face] & isMember[twinFaces]
+        adjacency = sparse.coo_matrix((np.ones(np.count_nonzero(joined), dtype=np.int8), (mesh.face[joined], twinFaces[joined])), shape=(mesh.totalFaces, mesh.totalFaces))
+        _, labels = csgraph.connected_components(adjacency, directed=False)
+        memberFaces = np.flatnonzero(isMember)
+        _, firstMembers, memberGroups = np.unique(labels[memberFaces], return_index=True, return_inverse=True)
+        # Renumber groups by the position of their first hex
+        groupRanks = np.empty(len(firstMembers), dtype=np.intp)
+        groupRanks[np.argsort(firstMembers)] = np.arange(len(firstMembers))
+        groups = [dict() for i in range(len(firstMembers))]
+        for face, group in zip(memberFaces.tolist(), groupRanks[memberGroups].tolist()):
+            hexIndex = mesh.faceHexIndices[face]
+            groups[group][hexIndex] = hexes[hexIndex]
+        return groups
+
+    # Region of a group of hexes, which are given a new random fill colour
+    def createColouredRegion(self, groupedHexes):
         fillColor = (random.randint(0,255), random.randint(0,255), random.randint(0,255), 255)
-        # Take a hex from the list of unassigned
-        nextHex = unassignedHexes.pop(random.choice(list(unassignedHexes.keys())))
-
-        groupedHexes = []
-        # Add it and its like-regioned neighbours to a list
-        explorableHexes = [nextHex]
-        while explorableHexes:
-            unexploredHex = explorableHexes.pop()
-            groupedHexes.append(unexploredHex)
-            # If there are still hexes left to find, check hex's neighbours
-            if unassignedHexes:
-                explorableHexes.extend(self.floodFillLandNeighbours(unexploredHex, unassignedHexes))
-        island = dict()
-        for gHex in groupedHexes:
-            island[gHex.hexIndex] = gHex
-            # Apply some behaviour to hexes in region
+        for gHex in groupedHexes.values():
             gHex.fillColor = fillColor
-        # Create region with hexes and store as an island
-        return regions.Region(island)
-
-    # Check nextHex's neighbours for validity, return list of those which are valid
-    def floodFillLandNeighbours(self, nextHex, remainingHexes):
-        #print("Hex "  + str(nextHex.hexIndex))
-        groupedNeighbours = []
-        # Only continue of there are hexes remaining
-        #print("Hex has %d neighbours." % (len(nextHex.neighbours)))
-        # Determine which neighbours are valid
-        for neighbour in nextHex.neighbours.values():
-            # If neighbour is tagged as land and exists in remainingHexes
-            if neighbour.hexIndex in remainingHexes:
-                # Add this neighbour to group
-                groupedNeighbours.append(remainingHexes.pop(neighbour.hexIndex))
-        #print("Returning grouped neighbours:")
-        #print(groupedNeighbours)
-        return groupedNeighbours
+        return regions.Region(groupedHexes)
 
     # Hexagons which are created with points outside of world limits which must have their OOB points shifted to the perimeter
     def clipGridHexagonsToWorldDimensions(self, printOOBChecks=False):